@@ -6,7 +6,9 @@ import random
 import datetime
 
 from modules import memory, prompt, utils
+from modules.model.cache import get_memo_cache
 from modules.model.llm_model import create_llm_model
+from modules.model.poignancy import get_poignancy_estimator
 from modules.memory.associate import Concept
 
 
@@ -22,6 +24,7 @@ class Agent:
         self.percept_config = config["percept"]
         self.think_config = config["think"]
         self.chat_iter = config["chat_iter"]
+        self.chat_engine = config.get("chat_engine", "turns")
 
         # memory
         self.spatial = memory.Spatial(**config["spatial"])
@@ -30,9 +33,30 @@ class Agent:
             os.path.join(config["storage_root"], "associate"), **config["associate"]
         )
         self.concepts, self.chats = [], config.get("chats", [])
+        self.reflection, self._reflect_future = config.get("reflection"), None
+        if self.think_config.get("poignancy_estimator"):
+            self.poignancy_estimator = get_poignancy_estimator(
+                self.think_config["poignancy_estimator"]
+            )
+        else:
+            self.poignancy_estimator = None
+        if self.think_config.get("chat_gate"):
+            self.chat_gate = {"decisions": {}, "summary": {}}
+        else:
+            self.chat_gate = None
+        if self.think_config.get("repeat_check"):
+            self.repeat_detector = utils.RepeatDetector(**self.think_config["repeat_check"])
+        else:
+            self.repeat_detector = None
+        if self.think_config.get("describe_cache"):
+            self.describe_cache = get_memo_cache(self.think_config["describe_cache"])
+        else:
+            self.describe_cache = None
 
         # prompt
-        self.scratch = prompt.Scratch(self.name, config["currently"], config["scratch"])
+        self.scratch = prompt.Scratch(
+            self.name, config["currently"], config["scratch"], **config.get("prompt", {})
+        )
 
         # status
         status = {"poignancy": 0}
@@ -71,7 +95,18 @@ class Agent:
             "chats": self.chats,
             "action": self.action.abstract(),
             "associate": self.associate.abstract(),
+            "scratch": self.scratch.get_summary(),
         }
+        if self.poignancy_estimator:
+            des["poignancy_estimator"] = self.poignancy_estimator.abstract()
+        if self.describe_cache:
+            des["describe_cache"] = self.describe_cache.abstract()
+        if self.associate.index.embedding_cache:
+            des["embedding_cache"] = self.associate.index.embedding_cache.abstract()
+        if self.repeat_detector:
+            des["repeat_check"] = self.repeat_detector.abstract()
+        if self.chat_gate and self.chat_gate["summary"]:
+            des["chat_gate"] = self.chat_gate["summary"]
         if self.schedule.scheduled():
             des["schedule"] = self.schedule.abstract()
         if self.llm_available():
@@ -90,16 +125,49 @@ class Agent:
             self._llm = create_llm_model(self.think_config["llm"])
 
     def completion(self, func_hint, *args, **kwargs):
+        prompt = self._build_prompt(func_hint, *args, **kwargs)
+        return self._complete(func_hint, prompt)
+
+    def _complete(self, func_hint, prompt):
+        responses = None
+        if self.llm_available():
+            self.logger.info("{} -> {}".format(self.name, func_hint))
+            output = self._llm.completion(**prompt, caller=func_hint)
+            responses = self._llm.meta_responses
+        else:
+            output = prompt.get("failsafe")
+        self._log_completion(func_hint, prompt, responses, output)
+        return output
+
+    async def acompletion(self, func_hint, *args, **kwargs):
+        """Async version of completion, use utils.run_async to run prompts concurrently"""
+
+        prompt = self._build_prompt(func_hint, *args, **kwargs)
+        return await self._acomplete(func_hint, prompt)
+
+    async def _acomplete(self, func_hint, prompt):
+        responses = None
+        if self.llm_available():
+            self.logger.info("{} -> {}".format(self.name, func_hint))
+            responses = []
+            output = await self._llm.acompletion(
+                **prompt, caller=func_hint, meta_responses=responses
+            )
+        else:
+            output = prompt.get("failsafe")
+        self._log_completion(func_hint, prompt, responses, output)
+        return output
+
+    def _build_prompt(self, func_hint, *args, **kwargs):
         assert hasattr(
             self.scratch, "prompt_" + func_hint
         ), "Can not find func prompt_{} from scratch".format(func_hint)
         func = getattr(self.scratch, "prompt_" + func_hint)
-        prompt = func(*args, **kwargs)
+        return func(*args, **kwargs)
+
+    def _log_completion(self, func_hint, prompt, responses, output):
         title, msg = "{}.{}".format(self.name, func_hint), {}
-        if self.llm_available():
-            self.logger.info("{} -> {}".format(self.name, func_hint))
-            output = self._llm.completion(**prompt, caller=func_hint)
-            responses = self._llm.meta_responses
+        if responses is not None:
             msg = {"<PROMPT>": "\n" + prompt["prompt"] + "\n"}
             msg.update(
                 {
@@ -107,11 +175,8 @@ class Agent:
                     for idx, r in enumerate(responses)
                 }
             )
-        else:
-            output = prompt.get("failsafe")
         msg["<OUTPUT>"] = "\n" + str(output) + "\n"
         self.logger.debug(utils.block_msg(title, msg))
-        return output
 
     def think(self, status, agents):
         events = self.move(status["coord"], status.get("path"))
@@ -142,6 +207,10 @@ class Agent:
         else:
             if self.action.finished():
                 self.action = self._determine_action()
+            if self.reflection:
+                # keep collecting the pending reflection while sleeping
+                self.reflect()
+        self.associate.index.flush()
 
         emojis = {}
         if self.action:
@@ -217,10 +286,12 @@ class Agent:
             seed = [(h, "睡觉") for h in hours[:wake_up]]
             seed += [(h, "") for h in hours[wake_up:]]
             schedule = {}
-            for _ in range(self.schedule.max_try):
+            prompt = self._build_prompt("schedule_daily", wake_up, init_schedule)
+            for idx in range(self.schedule.max_try):
                 schedule = {h: s for h, s in seed[:wake_up]}
+                # retries resample, so only the first try may come from the cache
                 schedule.update(
-                    self.completion("schedule_daily", wake_up, init_schedule)
+                    self._complete("schedule_daily", dict(prompt, cache=idx == 0))
                 )
                 if len(set(schedule.values())) >= self.schedule.diversity:
                     break
@@ -295,22 +366,32 @@ class Agent:
         events = list(sorted(events.keys(), key=lambda k: events[k]))
         # get concepts
         self.concepts, valid_num = [], 0
+        recent_nodes = (
+            self.associate.retrieve_events() + self.associate.retrieve_chats()
+        )
+        recent_nodes = set(n.describe for n in recent_nodes)
+        attended = []
         for idx, event in enumerate(events[: self.percept_config["att_bandwidth"]]):
-            recent_nodes = (
-                self.associate.retrieve_events() + self.associate.retrieve_chats()
-            )
-            recent_nodes = set(n.describe for n in recent_nodes)
             if event.get_describe() not in recent_nodes:
-                if event.object == "idle" or event.object == "空闲":
-                    node = Concept.from_event(
-                        "idle_" + str(idx), "event", event, poignancy=1
-                    )
-                else:
-                    valid_num += 1
-                    node_type = "chat" if event.fit(self.name, "对话") else "event"
-                    node = self._add_concept(node_type, event)
-                    self.status["poignancy"] += node.poignancy
-                self.concepts.append(node)
+                recent_nodes.add(event.get_describe())
+                attended.append((idx, event))
+        scoring = [
+            ("chat" if event.fit(self.name, "对话") else "event", event)
+            for _, event in attended
+            if event.object not in ("idle", "空闲")
+        ]
+        scores = self._score_poignancy(scoring)
+        for idx, event in attended:
+            if event.object == "idle" or event.object == "空闲":
+                node = Concept.from_event(
+                    "idle_" + str(idx), "event", event, poignancy=1
+                )
+            else:
+                valid_num += 1
+                node_type = "chat" if event.fit(self.name, "对话") else "event"
+                node = self._add_concept(node_type, event, poignancy=scores.get(event))
+                self.status["poignancy"] += node.poignancy
+            self.concepts.append(node)
         self.concepts = [c for c in self.concepts if c.event.subject != self.name]
         self.logger.info(
             "{} percept {}/{} concepts".format(self.name, valid_num, len(self.concepts))
@@ -342,21 +423,27 @@ class Agent:
         return event
 
     def reflect(self):
-        def _add_thought(thought, evidence=None):
-            # event = self.completion(
-            #     "describe_event",
-            #     self.name,
-            #     thought,
-            #     address=self.get_tile().get_address(),
-            # )
-            event = self.make_event(self.name, thought, self.get_tile().get_address())
-            return self._add_concept("thought", event, filling=evidence)
+        if self.reflection or self.think_config.get("reflect_mode", "sync") == "background":
+            return self._reflect_background()
+        nodes = self._reflect_nodes()
+        if not nodes:
+            return
+        focus = self.completion("reflect_focus", nodes, 3)
+        retrieved = self.associate.retrieve_focus(focus, reduce_all=False)
+        chats, evidence = self.chats, self._reflect_evidence(self.chats)
+        results = self._run_prompts(self._reflect_prompts(retrieved, chats))
+        thoughts = self._reflect_thoughts(results, chats, evidence)
+        address = self.get_tile().get_address()
+        self._add_thoughts(self._score_thoughts(thoughts, address))
+        self.status["poignancy"] = 0
+        self.chats = []
 
+    def _reflect_nodes(self):
         if self.status["poignancy"] < self.think_config["poignancy_max"]:
-            return
+            return None
         nodes = self.associate.retrieve_events() + self.associate.retrieve_thoughts()
         if not nodes:
-            return
+            return None
         self.logger.info(
             "{} reflect(P{}/{}) with {} concepts...".format(
                 self.name,
@@ -365,32 +452,139 @@ class Agent:
                 len(nodes),
             )
         )
-        nodes = sorted(nodes, key=lambda n: n.access, reverse=True)[
+        return sorted(nodes, key=lambda n: n.access, reverse=True)[
             : self.associate.max_importance
         ]
-        # summary thought
-        focus = self.completion("reflect_focus", nodes, 3)
-        retrieved = self.associate.retrieve_focus(focus, reduce_all=False)
-        for r_nodes in retrieved.values():
-            thoughts = self.completion("reflect_insights", r_nodes, 5)
-            for thought, evidence in thoughts:
-                _add_thought(thought, evidence)
+
+    def _reflect_evidence(self, chats):
+        recorded, evidence = set(), []
+        for name, _ in chats:
+            if name == self.name or name in recorded:
+                continue
+            res = self.associate.retrieve_chats(name)
+            if res and len(res) > 0:
+                node = res[-1]
+                evidence.append(node.node_id)
+        return evidence
+
+    def _reflect_prompts(self, retrieved, chats):
+        """Build the prompts of thoughts, return (func_hint, prompt) pairs"""
+
+        prompts = [
+            ("reflect_insights", self._build_prompt("reflect_insights", r, 5))
+            for r in retrieved.values()
+        ]
+        if chats:
+            for func_hint in ["reflect_chat_planing", "reflect_chat_memory"]:
+                prompts.append((func_hint, self._build_prompt(func_hint, chats)))
+        return prompts
+
+    def _run_prompts(self, prompts):
+        """Run the built prompts concurrently, safe to call from background workers"""
+
+        return utils.run_async(*[self._acomplete(h, p) for h, p in prompts])
+
+    def _reflect_thoughts(self, results, chats, evidence):
+        """Generate (thought, evidence) pairs from the results of _reflect_prompts"""
+
+        insights_num = len(results) - 2 if chats else len(results)
+        thoughts = []
+        for insights in results[:insights_num]:
+            thoughts.extend(insights)
         # summary chats
-        if self.chats:
-            recorded, evidence = set(), []
-            for name, _ in self.chats:
-                if name == self.name or name in recorded:
-                    continue
-                res = self.associate.retrieve_chats(name)
-                if res and len(res) > 0:
-                    node = res[-1]
-                    evidence.append(node.node_id)
-            thought = self.completion("reflect_chat_planing", self.chats)
-            _add_thought(f"对于 {self.name} 的计划：{thought}", evidence)
-            thought = self.completion("reflect_chat_memory", self.chats)
-            _add_thought(f"{self.name} {thought}", evidence)
-        self.status["poignancy"] = 0
-        self.chats = []
+        if chats:
+            planing, memory = results[insights_num:]
+            thoughts.append((f"对于 {self.name} 的计划：{planing}", evidence))
+            thoughts.append((f"{self.name} {memory}", evidence))
+        return thoughts
+
+    def _score_thoughts(self, thoughts, address):
+        """Score thoughts in batch, return (event, poignancy) pairs"""
+
+        events = [self.make_event(self.name, t, address) for t, _ in thoughts]
+        scores = self._score_poignancy([("thought", e) for e in events])
+        scored = []
+        for event in events:
+            poignancy = scores.get(event)
+            if poignancy is None:
+                poignancy = self._fixed_poignancy(event)
+            if poignancy is None:
+                poignancy = self._llm_poignancy("thought", event)
+            scored.append((event, poignancy))
+        return scored
+
+    def _add_thoughts(self, scored):
+        for event, _ in scored:
+            self.logger.debug("{} add associate {}".format(self.name, event))
+        return self.associate.add_nodes([("thought", e, p) for e, p in scored])
+
+    def _reflect_background(self):
+        """Run the LLM calls of reflection in background worker, merge the thoughts on a later step
+
+        Prompts are built, thoughts are scored and added on the simulation thread, only
+        the completions run in the worker. Each agent has at most one pending reflection,
+        its stage and inputs are saved in to_dict so it can be restarted on resume. The
+        reflection is waited for after reflect_max_lag steps, sleeping steps included.
+        """
+
+        state = self.reflection
+        if not state:
+            nodes = self._reflect_nodes()
+            if not nodes:
+                return
+            self.reflection = {
+                "stage": "focus",
+                "nodes": [n.node_id for n in nodes],
+                "chats": self.chats,
+                "evidence": self._reflect_evidence(self.chats),
+                "address": self.get_tile().get_address(),
+                "steps": 0,
+            }
+            self.status["poignancy"] = 0
+            self.chats = []
+            self._submit_reflection()
+            return
+        if not self._reflect_future:
+            # resumed from checkpoint
+            self._submit_reflection()
+        state["steps"] += 1
+        if not self._reflect_future.done():
+            if state["steps"] < self.think_config.get("reflect_max_lag", 5):
+                return
+            self.logger.info("{} waits for pending reflection".format(self.name))
+        results = self._reflect_future.result()
+        self._reflect_future = None
+        if state["stage"] == "focus":
+            retrieved = self.associate.retrieve_focus(results[0], reduce_all=False)
+            state["stage"] = "insights"
+            state["retrieved"] = {f: [n.node_id for n in r] for f, r in retrieved.items()}
+            self._submit_reflection()
+        else:
+            thoughts = self._reflect_thoughts(results, state["chats"], state["evidence"])
+            scored = self._score_thoughts(thoughts, state["address"])
+            self._add_thoughts(scored)
+            self.logger.info(
+                "{} merged {} thoughts after {} steps".format(
+                    self.name, len(scored), state["steps"]
+                )
+            )
+            self.reflection = None
+
+    def _submit_reflection(self):
+        state = self.reflection
+
+        def _concepts(node_ids):
+            return [
+                self.associate.find_concept(n) for n in node_ids if self.associate.index.has_node(n)
+            ]
+
+        if state["stage"] == "focus":
+            nodes = _concepts(state["nodes"])
+            prompts = [("reflect_focus", self._build_prompt("reflect_focus", nodes, 3))]
+        else:
+            retrieved = {f: _concepts(ids) for f, ids in state["retrieved"].items()}
+            prompts = self._reflect_prompts(retrieved, state["chats"])
+        self._reflect_future = utils.get_executor().submit(self._run_prompts, prompts)
 
     def find_path(self, agents):
         address = self.get_event().address
@@ -430,6 +624,10 @@ class Agent:
         plan, de_plan = self.schedule.current_plan()
         describes = [plan["describe"], de_plan["describe"]]
         address = self.spatial.find_address(describes[0], as_list=True)
+        spatial_cache = self.think_config.get("spatial_cache", False)
+        if not address and spatial_cache:
+            world = self.get_tile().get_address("world", as_list=True)
+            address = self.spatial.get_decision(describes, world)
         if not address:
             tile = self.get_tile()
             kwargs = {
@@ -451,9 +649,12 @@ class Agent:
             elif len(objs) > 1:
                 kwargs["address"].append(self.completion("determine_object", **kwargs))
             address = kwargs["address"]
+            if spatial_cache:
+                world = tile.get_address("world", as_list=True)
+                self.spatial.set_decision(describes, world, address)
 
         event = self.make_event(self.name, describes[-1], address)
-        obj_describe = self.completion("describe_object", address[-1], describes[-1])
+        obj_describe = self._describe_object(address[-1], describes[-1])
         obj_event = self.make_event(address[-1], obj_describe, address)
 
         event.emoji = f"{de_plan['describe']}"
@@ -465,6 +666,21 @@ class Agent:
             start=utils.get_timer().daily_time(de_plan["start"]),
         )
 
+    def _describe_object(self, obj, describe):
+        if not self.describe_cache:
+            return self.completion("describe_object", obj, describe)
+        key = "{}|{}".format(obj, describe)
+        obj_describe = self.describe_cache.get(key)
+        if obj_describe is not None:
+            return obj_describe
+        prompt = self._build_prompt("describe_object", obj, describe)
+        # only cache the states given by llm
+        obj_describe = self._complete("describe_object", dict(prompt, failsafe=None))
+        if obj_describe is None:
+            return prompt["failsafe"]
+        self.describe_cache.set(key, obj_describe)
+        return obj_describe
+
     def _reaction(self, agents=None, ignore_words=None):
         focus = None
         ignore_words = ignore_words or ["空闲"]
@@ -507,6 +723,27 @@ class Agent:
             return True
         return False
 
+    def _gate_chat(self, other):
+        """Reject obvious non-chat situations before decide_chat, return the reason"""
+
+        if not self.chat_gate:
+            return None
+        config = self.think_config["chat_gate"]
+        now = utils.get_timer().get_date()
+        hours = config.get("hours")
+        if hours and not hours[0] <= now.hour < hours[1]:
+            return "hour"
+        describe = other.get_event().get_describe(False)
+        if any(k in describe for k in config.get("focus_keywords", [])):
+            remain = (other.action.end - now).total_seconds() / 60
+            if remain >= config.get("focus_minutes", 30):
+                return "focused"
+        if other.name in self.chat_gate["decisions"]:
+            decided, decision = self.chat_gate["decisions"][other.name]
+            if not decision and utils.get_timer().get_delta(decided) < config.get("reject_cooldown", 30):
+                return "rejected"
+        return None
+
     def _chat_with(self, other, focus):
         if len(self.schedule.daily_schedule) < 1 or len(other.schedule.daily_schedule) < 1:
             # initializing
@@ -529,16 +766,59 @@ class Agent:
             if delta < 60:
                 return False
 
-        if not self.completion("decide_chat", self, other, focus, chats):
+        reason = self._gate_chat(other)
+        if reason:
+            self.chat_gate["summary"][reason] = self.chat_gate["summary"].get(reason, 0) + 1
+            self.logger.info(
+                "{} skips deciding chat with {}: {}".format(self.name, other.name, reason)
+            )
+            return False
+
+        decision = self.completion("decide_chat", self, other, focus, chats)
+        if self.chat_gate:
+            self.chat_gate["decisions"][other.name] = (utils.get_timer().get_date(), decision)
+        if not decision:
             return False
 
         self.logger.info("{} decides chat with {}".format(self.name, other.name))
-        start, chats = utils.get_timer().get_date(), []
+        start = utils.get_timer().get_date()
         relations = [
             self.completion("summarize_relation", self, other.name),
             other.completion("summarize_relation", other, self.name),
         ]
 
+        chats = None
+        if self.chat_engine == "single":
+            chats = self.completion(
+                "generate_dialogue", self, other, relations, self.chat_iter * 2
+            )
+        if not chats:
+            chats = self._chat_turns(other, relations)
+
+        key = utils.get_timer().get_date("%Y%m%d-%H:%M")
+        if key not in self.conversation.keys():
+            self.conversation[key] = []
+        self.conversation[key].append({f"{self.name} -> {other.name} @ {'，'.join(self.get_event().address)}": chats})
+
+        self.logger.info(
+            "{} and {} has chats\n  {}".format(
+                self.name,
+                other.name,
+                "\n  ".join(["{}: {}".format(n, c) for n, c in chats]),
+            )
+        )
+        chat_summary = self.completion("summarize_chats", chats)
+        duration = int(sum([len(c[1]) for c in chats]) / 240)
+        self.schedule_chat(
+            chats, chat_summary, start, duration, other
+        )
+        other.schedule_chat(chats, chat_summary, start, duration, self)
+        return True
+
+    def _chat_turns(self, other, relations):
+        """Generate the chats turn by turn, each agent speaks with its own prompts"""
+
+        chats = []
         for i in range(self.chat_iter):
             text = self.completion(
                 "generate_chat", self, other, relations[0], chats
@@ -546,9 +826,7 @@ class Agent:
 
             if i > 0:
                 # 对于发起对话的Agent，从第2轮对话开始，检查是否出现“复读”现象
-                end = self.completion(
-                    "generate_chat_check_repeat", self, chats, text
-                )
+                end = self._check_repeat(self, chats, text)
                 if end:
                     break
 
@@ -567,9 +845,7 @@ class Agent:
             )
             if i > 0:
                 # 对于响应对话的Agent，从第2轮开始，检查是否出现“复读”现象
-                end = self.completion(
-                    "generate_chat_check_repeat", other, chats, text
-                )
+                end = self._check_repeat(other, chats, text)
                 if end:
                     break
 
@@ -581,26 +857,17 @@ class Agent:
             )
             if end:
                 break
-
-        key = utils.get_timer().get_date("%Y%m%d-%H:%M")
-        if key not in self.conversation.keys():
-            self.conversation[key] = []
-        self.conversation[key].append({f"{self.name} -> {other.name} @ {'，'.join(self.get_event().address)}": chats})
-
-        self.logger.info(
-            "{} and {} has chats\n  {}".format(
-                self.name,
-                other.name,
-                "\n  ".join(["{}: {}".format(n, c) for n, c in chats]),
-            )
-        )
-        chat_summary = self.completion("summarize_chats", chats)
-        duration = int(sum([len(c[1]) for c in chats]) / 240)
-        self.schedule_chat(
-            chats, chat_summary, start, duration, other
-        )
-        other.schedule_chat(chats, chat_summary, start, duration, self)
-        return True
+        return chats
+
+    def _check_repeat(self, agent, chats, text):
+        if self.repeat_detector:
+            repeat = self.repeat_detector.check(text, [c for _, c in chats])
+            if repeat is not None:
+                self.logger.debug(
+                    "{} repeat check {}: {}".format(agent.name, "repeat" if repeat else "new", text)
+                )
+                return repeat
+        return self.completion("generate_chat_check_repeat", agent, chats, text)
 
     def _wait_other(self, other, focus):
         if self._skip_react(other):
@@ -645,15 +912,14 @@ class Agent:
         create=None,
         expire=None,
         filling=None,
+        poignancy=None,
     ):
-        if event.fit(None, "is", "idle"):
-            poignancy = 1
-        elif event.fit(None, "此时", "空闲"):
-            poignancy = 1
-        elif e_type == "chat":
-            poignancy = self.completion("poignancy_chat", event)
-        else:
-            poignancy = self.completion("poignancy_event", event)
+        if poignancy is None:
+            poignancy = self._fixed_poignancy(event)
+        if poignancy is None and e_type == "event" and self.poignancy_estimator:
+            poignancy = self.poignancy_estimator.estimate(event.get_describe(False))
+        if poignancy is None:
+            poignancy = self._llm_poignancy(e_type, event)
         self.logger.debug("{} add associate {}".format(self.name, event))
         return self.associate.add_node(
             e_type,
@@ -664,6 +930,49 @@ class Agent:
             filling=filling,
         )
 
+    def _fixed_poignancy(self, event):
+        if event.fit(None, "is", "idle"):
+            return 1
+        if event.fit(None, "此时", "空闲"):
+            return 1
+        return None
+
+    def _llm_poignancy(self, e_type, event):
+        func_hint = "poignancy_chat" if e_type == "chat" else "poignancy_event"
+        prompt = self._build_prompt(func_hint, event)
+        # failsafe scores are random, keep them away from the estimator
+        poignancy = self._complete(func_hint, dict(prompt, failsafe=None))
+        if poignancy is None:
+            return prompt["failsafe"]
+        if e_type == "event" and self.poignancy_estimator:
+            self.poignancy_estimator.observe(event.get_describe(False), poignancy)
+        return poignancy
+
+    def _score_poignancy(self, events):
+        """Score (e_type, event) pairs in one completion, return {event: poignancy}
+
+        Events missing from the result are scored one by one in _add_concept.
+        """
+
+        scores, pending = {}, []
+        for e_type, event in events:
+            if self._fixed_poignancy(event) is not None:
+                continue
+            if e_type == "event" and self.poignancy_estimator:
+                poignancy = self.poignancy_estimator.estimate(event.get_describe(False))
+                if poignancy is not None:
+                    scores[event] = poignancy
+                    continue
+            pending.append((e_type, event))
+        if len(pending) < 2 or not self.think_config.get("poignancy_batch", False):
+            return scores
+        batch = self.completion("poignancy_batch", pending)
+        for (e_type, event), poignancy in zip(pending, batch or []):
+            scores[event] = poignancy
+            if e_type == "event" and self.poignancy_estimator:
+                self.poignancy_estimator.observe(event.get_describe(False), poignancy)
+        return scores
+
     def get_tile(self):
         return self.maze.tile_at(self.coord)
 
@@ -685,12 +994,17 @@ class Agent:
         return self._llm.is_available()
 
     def to_dict(self, with_action=True):
+        if self.poignancy_estimator:
+            self.poignancy_estimator.save()
+        if self.describe_cache:
+            self.describe_cache.save()
         info = {
             "status": self.status,
             "schedule": self.schedule.to_dict(),
             "associate": self.associate.to_dict(),
             "chats": self.chats,
             "currently": self.scratch.currently,
+            "reflection": self.reflection,
         }
         if with_action:
             info.update({"action": self.action.to_dict()})
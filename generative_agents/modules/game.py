@@ -34,8 +34,23 @@ class Game:
             agent_config = utils.update_dict(agent_config, agent)
 
             agent_config["storage_root"] = os.path.join(storage_root, name)
+            think = agent_config["think"]
+            self._default_path(think["llm"], "cache", "llm_cache.db")
+            self._default_path(think["llm"], "cassette", "llm_cassette.jsonl")
+            if (think.get("poignancy_estimator") or {}).get("learned", True):
+                self._default_path(think, "poignancy_estimator", "poignancy.json")
+            self._default_path(think, "describe_cache", "describe_object.json")
+            self._default_path(
+                agent_config["associate"]["embedding"], "cache", "embedding_cache.bin"
+            )
             self.agents[name] = Agent(agent_config, self.maze, self.conversation, self.logger)
 
+    def _default_path(self, config, key, filename):
+        """Save the enabled config[key] under the checkpoint folder if it has no path"""
+
+        if config.get(key) and not config[key].get("path"):
+            config[key]["path"] = os.path.join(f"results/checkpoints/{self.name}", filename)
+
     def get_agent(self, name):
         return self.agents[name]
 
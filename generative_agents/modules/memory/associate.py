@@ -172,9 +172,28 @@ class Associate:
         expire=None,
         filling=None,
     ):
+        metadata = self._make_metadata(node_type, event, poignancy, create, expire)
+        node = self._index.add_node(event.get_describe(), metadata)
+        self._remember(node_type, node)
+        return self.to_concept(node)
+
+    def add_nodes(self, items):
+        """Add (node_type, event, poignancy) items in one batch, return the concepts"""
+
+        nodes = self._index.add_nodes(
+            [
+                (event.get_describe(), self._make_metadata(node_type, event, poignancy))
+                for node_type, event, poignancy in items
+            ]
+        )
+        for (node_type, _, _), node in zip(items, nodes):
+            self._remember(node_type, node)
+        return [self.to_concept(n) for n in nodes]
+
+    def _make_metadata(self, node_type, event, poignancy, create=None, expire=None):
         create = create or utils.get_timer().get_date()
         expire = expire or (create + datetime.timedelta(days=30))
-        metadata = {
+        return {
             "node_type": node_type,
             "subject": event.subject,
             "predicate": event.predicate,
@@ -185,13 +204,13 @@ class Associate:
             "expire": expire.strftime("%Y%m%d-%H:%M:%S"),
             "access": create.strftime("%Y%m%d-%H:%M:%S"),
         }
-        node = self._index.add_node(event.get_describe(), metadata)
+
+    def _remember(self, node_type, node):
         memory = self.memory[node_type]
         memory.insert(0, node.id_)
         if len(memory) >= self.max_memory > 0:
             self._index.remove_nodes(memory[self.max_memory:])
             self.memory[node_type] = memory[: self.max_memory - 1]
-        return self.to_concept(node)
 
     def to_concept(self, node):
         return Concept.from_node(node)
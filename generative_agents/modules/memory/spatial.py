@@ -9,6 +9,9 @@ class Spatial:
     def __init__(self, tree, address=None):
         self.tree = tree
         self.address = address or {}
+        # versions of subtrees, bumped when the children of a subtree change
+        self._versions = {}
+        self._decisions = {}
         if "sleeping" not in self.address and "睡觉" not in self.address and "living_area" in self.address:
             # self.address["sleeping"] = self.address["living_area"] + ["bed"]
             self.address["睡觉"] = self.address["living_area"] + ["床"]
@@ -17,15 +20,44 @@ class Spatial:
         return utils.dump_dict(self.tree)
 
     def add_leaf(self, address):
-        def _add_leaf(left_address, tree):
+        def _bump(prefix):
+            self._versions[prefix] = self._versions.get(prefix, 0) + 1
+
+        def _add_leaf(left_address, tree, prefix):
+            if left_address[0] not in tree:
+                _bump(prefix)
             if len(left_address) == 2:
                 leaves = tree.setdefault(left_address[0], [])
                 if left_address[1] not in leaves:
                     leaves.append(left_address[1])
+                    _bump(prefix + (left_address[0],))
             elif len(left_address) > 2:
-                _add_leaf(left_address[1:], tree.setdefault(left_address[0], {}))
+                _add_leaf(
+                    left_address[1:],
+                    tree.setdefault(left_address[0], {}),
+                    prefix + (left_address[0],),
+                )
+
+        _add_leaf(address, self.tree, ())
+
+    def version(self, address):
+        return self._versions.get(tuple(address), 0)
+
+    def get_decision(self, describes, root):
+        """Get the address decided for describes under root, None if the subtrees changed"""
+
+        key = (tuple(describes), tuple(root))
+        if key not in self._decisions:
+            return None
+        address, versions = self._decisions[key]
+        if any(self.version(address[:i]) != v for i, v in versions):
+            self._decisions.pop(key)
+            return None
+        return list(address)
 
-        _add_leaf(address, self.tree)
+    def set_decision(self, describes, root, address):
+        versions = [(i, self.version(address[:i])) for i in range(len(root), len(address))]
+        self._decisions[(tuple(describes), tuple(root))] = (list(address), versions)
 
     def find_address(self, hint, as_list=True):
         address = []
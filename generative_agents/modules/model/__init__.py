@@ -1,3 +1,8 @@
 """generative_agents.model"""
 
+from .balance import *
+from .cache import *
+from .cassette import *
 from .llm_model import *
+from .poignancy import *
+from .transport import *
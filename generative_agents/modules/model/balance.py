@@ -0,0 +1,102 @@
+"""generative_agents.model.balance"""
+
+import time
+import random
+import threading
+
+from modules.utils import GenerativeAgentsMap, GenerativeAgentsKey
+
+
+class Endpoint:
+    """Load statistics of an llm endpoint, shared by all agents"""
+
+    def __init__(self, url, decay=0.3, eject_failures=3, eject_time=30):
+        self.url = url
+        self.decay = decay
+        self.eject_failures = eject_failures
+        self.eject_time = eject_time
+        self.outstanding = 0
+        self.latency = None
+        self.failures = 0
+        self.ejected_until = 0
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        with self._lock:
+            self.outstanding += 1
+        return time.time()
+
+    def release(self, start, failed=False):
+        with self._lock:
+            self.outstanding -= 1
+            if failed:
+                self.failures += 1
+                if self.failures >= self.eject_failures:
+                    self.eject()
+                return
+            latency = time.time() - start
+            if self.latency is None:
+                self.latency = latency
+            else:
+                self.latency = self.decay * latency + (1 - self.decay) * self.latency
+            self.failures = 0
+
+    def eject(self):
+        self.ejected_until = time.time() + self.eject_time
+
+    def readmit(self):
+        self.failures, self.ejected_until = 0, 0
+
+    @property
+    def ejected(self):
+        return self.ejected_until > 0
+
+    @property
+    def expired(self):
+        """Ejected endpoint that should be health checked"""
+
+        return 0 < self.ejected_until <= time.time()
+
+    def load(self, strategy):
+        if strategy == "ewma":
+            # endpoints without latency record are tried first
+            return (self.latency or 0) * (self.outstanding + 1), self.outstanding
+        return self.outstanding, self.latency or 0
+
+    def abstract(self):
+        status = "O:{},L:{}".format(
+            self.outstanding, int(self.latency * 1000) if self.latency else "-"
+        )
+        if self.ejected:
+            status += ",ejected"
+        return status
+
+
+def get_endpoint(url, config=None):
+    """Get the endpoint statistics shared by models with the same url"""
+
+    endpoints = GenerativeAgentsMap.get(GenerativeAgentsKey.ENDPOINTS)
+    if endpoints is None:
+        endpoints = {}
+        GenerativeAgentsMap.set(GenerativeAgentsKey.ENDPOINTS, endpoints)
+    if url not in endpoints:
+        config = config or {}
+        endpoints[url] = Endpoint(
+            url,
+            decay=config.get("decay", 0.3),
+            eject_failures=config.get("eject_failures", 3),
+            eject_time=config.get("eject_time", 30),
+        )
+    return endpoints[url]
+
+
+def pick_endpoint(endpoints, strategy="least_outstanding"):
+    """Pick the endpoint with lowest load, random among the ties"""
+
+    candidates = [e for e in endpoints if not e.ejected]
+    if not candidates:
+        return None
+    # loads change in other threads, so read each of them only once
+    loads = [(e, e.load(strategy)) for e in candidates]
+    best = min(load for _, load in loads)
+    return random.choice([e for e, load in loads if load == best])
@@ -0,0 +1,171 @@
+"""generative_agents.model.cache"""
+
+import os
+import json
+import time
+import sqlite3
+import hashlib
+import threading
+from collections import OrderedDict
+
+from modules import utils
+from modules.utils import GenerativeAgentsKey
+
+
+class LLMCache:
+    """Disk-backed llm response cache, evicts least recently used responses by size"""
+
+    def __init__(self, path, max_size=64):
+        self.path = path
+        self.max_size = int(max_size * 1024 * 1024)
+        folder = os.path.dirname(path)
+        if folder and not os.path.isdir(folder):
+            os.makedirs(folder)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS responses "
+            "(key TEXT PRIMARY KEY, response TEXT, size INTEGER, access REAL)"
+        )
+        self._conn.commit()
+        self._size = self._conn.execute(
+            "SELECT COALESCE(SUM(size), 0) FROM responses"
+        ).fetchone()[0]
+
+    @staticmethod
+    def make_key(provider, model, temperature, prompt):
+        text = "\n".join([provider, model, str(temperature), prompt])
+        return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+    def get(self, key):
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT response FROM responses WHERE key=?", (key,)
+            ).fetchone()
+            if row is None:
+                return None
+            self._conn.execute(
+                "UPDATE responses SET access=? WHERE key=?", (time.time(), key)
+            )
+            self._conn.commit()
+            return row[0]
+
+    def set(self, key, response):
+        size = len(key) + len(response.encode("utf-8"))
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT size FROM responses WHERE key=?", (key,)
+            ).fetchone()
+            if row:
+                self._size -= row[0]
+            self._conn.execute(
+                "INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?)",
+                (key, response, size, time.time()),
+            )
+            self._size += size
+            if self._size > self.max_size:
+                self._evict()
+            self._conn.commit()
+
+    def remove(self, key):
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT size FROM responses WHERE key=?", (key,)
+            ).fetchone()
+            if row:
+                self._conn.execute("DELETE FROM responses WHERE key=?", (key,))
+                self._conn.commit()
+                self._size -= row[0]
+
+    def _evict(self):
+        # drop the least recently used responses until 90% of max_size
+        target = self.max_size * 0.9
+        rows = self._conn.execute("SELECT key, size FROM responses ORDER BY access")
+        removed = []
+        for key, size in rows:
+            if self._size <= target:
+                break
+            removed.append((key,))
+            self._size -= size
+        self._conn.executemany("DELETE FROM responses WHERE key=?", removed)
+
+    @property
+    def size(self):
+        return self._size
+
+
+def get_llm_cache(config):
+    """Get the cache shared by models with the same cache path"""
+
+    return utils.shared(
+        GenerativeAgentsKey.LLM_CACHES,
+        config["path"],
+        lambda path: LLMCache(path, config.get("max_size", 64)),
+    )
+
+
+class MemoCache:
+    """Parsed outputs shared by agents, expire in simulated minutes and evict least recently used"""
+
+    def __init__(self, path=None, capacity=1024, ttl=1440):
+        self.path = path
+        self.capacity = capacity
+        self.ttl = ttl
+        self._items = OrderedDict()
+        self._summary = {"hit": 0, "miss": 0}
+        self._dirty = False
+        self._lock = threading.Lock()
+        if path and os.path.exists(path):
+            with open(path, "r", encoding="utf-8") as f:
+                for key, (value, created) in json.load(f).items():
+                    self._items[key] = (value, utils.to_date(created, "%Y%m%d-%H:%M:%S"))
+
+    def get(self, key):
+        with self._lock:
+            if key in self._items:
+                value, created = self._items[key]
+                if utils.get_timer().get_delta(created) <= self.ttl:
+                    self._items.move_to_end(key)
+                    self._summary["hit"] += 1
+                    return value
+                self._items.pop(key)
+                self._dirty = True
+            self._summary["miss"] += 1
+            return None
+
+    def set(self, key, value):
+        with self._lock:
+            self._items[key] = (value, utils.get_timer().get_date())
+            self._items.move_to_end(key)
+            while len(self._items) > self.capacity:
+                self._items.popitem(last=False)
+            self._dirty = True
+
+    def save(self):
+        if not self._dirty or not self.path:
+            return
+        with self._lock:
+            data = {
+                k: (v, c.strftime("%Y%m%d-%H:%M:%S")) for k, (v, c) in self._items.items()
+            }
+            self._dirty = False
+        with open(self.path, "w", encoding="utf-8") as f:
+            json.dump(data, f, ensure_ascii=False)
+
+    def abstract(self):
+        return "H:{},M:{},S:{}".format(
+            self._summary["hit"], self._summary["miss"], len(self._items)
+        )
+
+
+def get_memo_cache(config):
+    """Get the memo cache shared by agents with the same path"""
+
+    return utils.shared(
+        GenerativeAgentsKey.MEMO_CACHES,
+        config.get("path") or None,
+        lambda path: MemoCache(
+            path, config.get("capacity", 1024), config.get("ttl", 1440)
+        ),
+    )
@@ -0,0 +1,98 @@
+"""generative_agents.model.cassette"""
+
+import os
+import json
+import gzip
+import hashlib
+import threading
+from collections import deque
+
+from modules.utils import GenerativeAgentsKey, shared
+
+
+class CassetteExhausted(KeyError):
+    """No recorded response left for the request"""
+
+
+class Cassette:
+    """Trace of llm requests, recorded from a real run and replayed in later runs
+
+    Each line holds the caller, model, prompt hash, response and latency. Replay serves
+    the responses of the same prompt in recorded order, and falls back to the next
+    unused response of the same caller when the prompt changed.
+    """
+
+    def __init__(self, path, mode="record", latency=False):
+        assert mode in ("record", "replay"), "Unexpected cassette mode " + str(mode)
+        self.path = path
+        self.mode = mode
+        self.latency = latency
+        self._lock = threading.Lock()
+        self._prompts, self._callers = {}, {}
+        if mode == "replay":
+            self._load()
+        else:
+            folder = os.path.dirname(path)
+            if folder and not os.path.isdir(folder):
+                os.makedirs(folder)
+            self._file = self._open("at")
+
+    def _open(self, flag):
+        if self.path.endswith(".gz"):
+            return gzip.open(self.path, flag, encoding="utf-8")
+        return open(self.path, flag, encoding="utf-8")
+
+    def _load(self):
+        with self._open("rt") as f:
+            for idx, line in enumerate(f):
+                if not line.strip():
+                    continue
+                record = json.loads(line)
+                record["idx"] = idx
+                self._prompts.setdefault(record["h"], deque()).append(record)
+                self._callers.setdefault(record["c"], deque()).append(record)
+        self._used = set()
+
+    @staticmethod
+    def hash_prompt(prompt):
+        return hashlib.sha1(prompt.encode("utf-8")).hexdigest()[:16]
+
+    def record(self, caller, model, prompt, response, latency):
+        record = {
+            "c": caller,
+            "m": model,
+            "h": self.hash_prompt(prompt),
+            "r": response,
+            "l": round(latency, 3),
+        }
+        with self._lock:
+            self._file.write(json.dumps(record, ensure_ascii=False) + "\n")
+            self._file.flush()
+
+    def replay(self, caller, prompt):
+        """Return (response, latency) of the recorded request"""
+
+        with self._lock:
+            for queue in (self._prompts.get(self.hash_prompt(prompt)), self._callers.get(caller)):
+                while queue:
+                    record = queue.popleft()
+                    if record["idx"] not in self._used:
+                        self._used.add(record["idx"])
+                        return record["r"], record["l"]
+        raise CassetteExhausted("No recorded response for {} in {}".format(caller, self.path))
+
+    def close(self):
+        if self.mode == "record":
+            self._file.close()
+
+
+def get_cassette(config):
+    """Get the cassette shared by models with the same path"""
+
+    return shared(
+        GenerativeAgentsKey.CASSETTES,
+        config["path"],
+        lambda path: Cassette(
+            path, config.get("mode", "record"), config.get("latency", False)
+        ),
+    )
@@ -2,16 +2,45 @@
 
 import time
 import re
-import requests
+import copy
+import asyncio
+import threading
+import weakref
+
+from modules import utils
+from .balance import get_endpoint, pick_endpoint
+from .cache import get_llm_cache
+from .cassette import CassetteExhausted, get_cassette
+from .transport import get_transport
 
 
 class LLMModel:
     def __init__(self, config):
+        self._provider = config["provider"]
         self._api_key = config["api_key"]
         self._base_url = config["base_url"]
         self._model = config["model"]
         self._meta_responses = []
         self._summary = {"total": [0, 0, 0]}
+        # counters are shared with async completions running in background workers
+        self._lock = threading.Lock()
+        self._transport = get_transport(config.get("transport"))
+        if config.get("cassette"):
+            self._cassette = get_cassette(config["cassette"])
+        else:
+            self._cassette = None
+        # cached responses would bypass the cassette, so cache is off with cassette
+        if config.get("cache") and not self._cassette:
+            self._cache = get_llm_cache(config["cache"])
+        else:
+            self._cache = None
+        self._cache_summary = {"hit": 0, "miss": 0}
+        # request json output from backends that support it for structured prompts
+        self._structured = config.get("structured", False)
+        self._repair_summary = {}
+        self._retry = utils.RetryPolicy.from_config(
+            config.get("retry"), breaker_key=self.breaker_key
+        )
 
         self._handle = self.setup(config)
         self._enabled = True
@@ -28,45 +57,229 @@ class LLMModel:
         callback=None,
         failsafe=None,
         caller="llm_normal",
+        deadline=None,
+        repair=None,
+        structured=False,
+        cache=True,
         **kwargs
     ):
-        response, self._meta_responses = None, []
-        self._summary.setdefault(caller, [0, 0, 0])
-        for _ in range(retry):
+        self._meta_responses = []
+        with self._lock:
+            self._summary.setdefault(caller, [0, 0, 0])
+        if structured and self._structured:
+            kwargs["json_mode"] = True
+        parser = self._parser(caller, callback, repair)
+        # resampling callers skip the cache, a cached response would come back every time
+        key = self._cache_key(prompt, **kwargs) if cache else None
+        response = self._from_cache(key, parser, self._meta_responses)
+        retrying = self._retry.start(caller, retry, deadline)
+        while response is None and retrying.allow():
+            self._count_retry(caller, retrying)
             try:
-                meta_response = self._completion(prompt, **kwargs).strip()
-                self._meta_responses.append(meta_response)
-                self._summary["total"][0] += 1
-                self._summary[caller][0] += 1
-                if callback:
-                    response = callback(meta_response)
-                else:
-                    response = meta_response
+                meta_response = self._request(caller, prompt, **kwargs).strip()
+            except CassetteExhausted as e:
+                print(f"LLMModel.completion() failed to replay: {e}")
+                break
             except Exception as e:
                 print(f"LLMModel.completion() caused an error: {e}")
-                time.sleep(5)
-                response = None
+                delay = retrying.fail()
+                if delay:
+                    time.sleep(delay)
                 continue
-            if response is not None:
+            retrying.succeed()
+            response = self._accept(caller, key, meta_response, parser, self._meta_responses)
+            if response is None:
+                retrying.fail(endpoint=False)
+        return self._finish(caller, response, failsafe)
+
+    async def acompletion(
+        self,
+        prompt,
+        retry=4,
+        callback=None,
+        failsafe=None,
+        caller="llm_normal",
+        deadline=None,
+        meta_responses=None,
+        repair=None,
+        structured=False,
+        cache=True,
+        **kwargs
+    ):
+        """Async version of completion, meta_responses collects the raw responses of this call"""
+
+        meta_responses = [] if meta_responses is None else meta_responses
+        with self._lock:
+            self._summary.setdefault(caller, [0, 0, 0])
+        if structured and self._structured:
+            kwargs["json_mode"] = True
+        parser = self._parser(caller, callback, repair)
+        key = self._cache_key(prompt, **kwargs) if cache else None
+        response = self._from_cache(key, parser, meta_responses)
+        retrying = self._retry.start(caller, retry, deadline)
+        while response is None and retrying.allow():
+            self._count_retry(caller, retrying)
+            try:
+                meta_response = (await self._arequest(caller, prompt, **kwargs)).strip()
+            except CassetteExhausted as e:
+                print(f"LLMModel.acompletion() failed to replay: {e}")
                 break
+            except Exception as e:
+                print(f"LLMModel.acompletion() caused an error: {e}")
+                delay = retrying.fail()
+                if delay:
+                    await asyncio.sleep(delay)
+                continue
+            retrying.succeed()
+            response = self._accept(caller, key, meta_response, parser, meta_responses)
+            if response is None:
+                retrying.fail(endpoint=False)
+        return self._finish(caller, response, failsafe)
+
+    def _request(self, caller, prompt, **kwargs):
+        if self._replaying:
+            meta_response, latency = self._cassette.replay(caller, prompt)
+            if self._cassette.latency and latency:
+                time.sleep(latency)
+            return meta_response
+        start = time.time()
+        meta_response = self._completion(prompt, **kwargs)
+        if self._cassette:
+            self._cassette.record(
+                caller, self._model, prompt, meta_response, time.time() - start
+            )
+        return meta_response
+
+    async def _arequest(self, caller, prompt, **kwargs):
+        if self._replaying:
+            meta_response, latency = self._cassette.replay(caller, prompt)
+            if self._cassette.latency and latency:
+                await asyncio.sleep(latency)
+            return meta_response
+        start = time.time()
+        meta_response = await self._acompletion(prompt, **kwargs)
+        if self._cassette:
+            self._cassette.record(
+                caller, self._model, prompt, meta_response, time.time() - start
+            )
+        return meta_response
+
+    def _parse(self, meta_response, callback):
+        if not callback:
+            return meta_response
+        try:
+            return callback(meta_response)
+        except Exception as e:
+            print(f"LLMModel callback caused an error: {e}")
+            return None
+
+    def _parser(self, caller, callback, repair=None):
+        """Wrap callback to salvage malformed responses locally before a retry"""
+
+        if not callback:
+            return None
+
+        def _salvage(meta_response):
+            try:
+                return callback(meta_response)
+            except Exception as e:
+                error = e
+            cleaned = repair_llm_output(meta_response)
+            candidates = [(callback, cleaned), (repair, cleaned or meta_response)]
+            for func, text in candidates:
+                if not func or text is None:
+                    continue
+                try:
+                    response = func(text)
+                except Exception:
+                    continue
+                if response is not None:
+                    with self._lock:
+                        self._repair_summary.setdefault(caller, [0, 0])[0] += 1
+                    return response
+            raise error
+
+        return _salvage
+
+    def _count_retry(self, caller, retrying):
+        if retrying.attempt > 0:
+            with self._lock:
+                self._repair_summary.setdefault(caller, [0, 0])[1] += 1
+
+    def _accept(self, caller, key, meta_response, callback, meta_responses):
+        with self._lock:
+            self._summary["total"][0] += 1
+            self._summary[caller][0] += 1
+        meta_responses.append(meta_response)
+        response = self._parse(meta_response, callback)
+        if response is not None and key:
+            self._cache.set(key, meta_response)
+        return response
+
+    def _finish(self, caller, response, failsafe):
         pos = 2 if response is None else 1
-        self._summary["total"][pos] += 1
-        self._summary[caller][pos] += 1
+        with self._lock:
+            self._summary["total"][pos] += 1
+            self._summary[caller][pos] += 1
         return response or failsafe
 
+    def _cache_key(self, prompt, temperature=0.5, **kwargs):
+        if not self._cache:
+            return None
+        return self._cache.make_key(self._provider, self._model, temperature, prompt)
+
+    def _from_cache(self, key, callback, meta_responses):
+        if not key:
+            return None
+        meta_response = self._cache.get(key)
+        with self._lock:
+            self._cache_summary["miss" if meta_response is None else "hit"] += 1
+        if meta_response is None:
+            return None
+        meta_responses.append(meta_response)
+        response = self._parse(meta_response, callback)
+        if response is None:
+            # drop the cached response rejected by callback
+            self._cache.remove(key)
+        return response
+
     def _completion(self, prompt, **kwargs):
         raise NotImplementedError(
             "_completion is not support for " + str(self.__class__)
         )
 
+    async def _acompletion(self, prompt, **kwargs):
+        # backends without async client run the blocking call in a worker thread
+        return await asyncio.to_thread(self._completion, prompt, **kwargs)
+
     def is_available(self):
         return self._enabled  # and self._summary["total"][2] <= 10
 
+    def health_check(self, timeout=2):
+        headers = {"Authorization": f"Bearer {self._api_key}"} if self._api_key else {}
+        try:
+            response = self._transport.get(
+                f"{self._base_url}/models", headers=headers, timeout=timeout
+            )
+            return response.status_code == 200
+        except Exception:
+            return False
+
     def get_summary(self):
         des = {}
-        for k, v in self._summary.items():
-            des[k] = "S:{},F:{}/R:{}".format(v[1], v[2], v[0])
-        return {"model": self._model, "summary": des}
+        with self._lock:
+            for k, v in self._summary.items():
+                des[k] = "S:{},F:{}/R:{}".format(v[1], v[2], v[0])
+            summary = {"model": self._model, "summary": des}
+            if self._cache:
+                summary["cache"] = "H:{},M:{}".format(
+                    self._cache_summary["hit"], self._cache_summary["miss"]
+                )
+            if self._repair_summary:
+                summary["repair"] = {
+                    k: "P:{},T:{}".format(*v) for k, v in self._repair_summary.items()
+                }
+        return summary
 
     def disable(self):
         self._enabled = False
@@ -75,28 +288,71 @@ class LLMModel:
     def meta_responses(self):
         return self._meta_responses
 
+    @property
+    def breaker_key(self):
+        return self._base_url
+
+    @property
+    def _replaying(self):
+        return self._cassette is not None and self._cassette.mode == "replay"
+
 
 class OpenAILLMModel(LLMModel):
     def setup(self, config):
         from openai import OpenAI
 
-        return OpenAI(api_key=self._api_key, base_url=self._base_url)
+        # one async handle per async client, i.e. per event loop of the calling thread
+        self._async_handles = weakref.WeakKeyDictionary()
+        return OpenAI(
+            api_key=self._api_key,
+            base_url=self._base_url,
+            http_client=self._transport.http_client,
+        )
 
-    def _completion(self, prompt, temperature=0.5):
+    def _completion(self, prompt, temperature=0.5, json_mode=False):
         messages = [{"role": "user", "content": prompt}]
         response = self._handle.chat.completions.create(
-            model=self._model, messages=messages, temperature=temperature
+            model=self._model,
+            messages=messages,
+            temperature=temperature,
+            **self._format_params(json_mode),
+        )
+        if len(response.choices) > 0:
+            return response.choices[0].message.content
+        return ""
+
+    async def _acompletion(self, prompt, temperature=0.5, json_mode=False):
+        from openai import AsyncOpenAI
+
+        http_client = self._transport.async_http_client
+        handle = self._async_handles.get(http_client)
+        if handle is None:
+            handle = AsyncOpenAI(
+                api_key=self._api_key, base_url=self._base_url, http_client=http_client
+            )
+            self._async_handles[http_client] = handle
+        messages = [{"role": "user", "content": prompt}]
+        response = await handle.chat.completions.create(
+            model=self._model,
+            messages=messages,
+            temperature=temperature,
+            **self._format_params(json_mode),
         )
         if len(response.choices) > 0:
             return response.choices[0].message.content
         return ""
 
+    def _format_params(self, json_mode):
+        if json_mode:
+            return {"response_format": {"type": "json_object"}}
+        return {}
+
 
 class OllamaLLMModel(LLMModel):
     def setup(self, config):
         return None
 
-    def ollama_chat(self, messages, temperature):
+    def _chat_params(self, messages, temperature, json_mode=False):
         headers = {
             "Content-Type": "application/json"
         }
@@ -106,31 +362,192 @@ class OllamaLLMModel(LLMModel):
             "temperature": temperature,
             "stream": False,
         }
+        if json_mode:
+            params["response_format"] = {"type": "json_object"}
+        return {"url": f"{self._base_url}/chat/completions", "headers": headers, "json": params}
+
+    def ollama_chat(self, messages, temperature, json_mode=False):
+        response = self._transport.post(
+            **self._chat_params(messages, temperature, json_mode), stream=False
+        )
+        return response.json()
 
-        response = requests.post(
-            url=f"{self._base_url}/chat/completions",
-            headers=headers,
-            json=params,
-            stream=False
+    async def aollama_chat(self, messages, temperature, json_mode=False):
+        response = await self._transport.apost(
+            **self._chat_params(messages, temperature, json_mode)
         )
         return response.json()
 
-    def _completion(self, prompt, temperature=0.5):
+    def _to_messages(self, prompt):
         if "qwen3" in self._model and "\n/nothink" not in prompt:
             # 针对Qwen3模型禁用think，提高推理速度
             prompt += "\n/nothink"
-        messages = [{"role": "user", "content": prompt}]
-        response = self.ollama_chat(messages=messages, temperature=temperature)
+        return [{"role": "user", "content": prompt}]
+
+    def _parse_response(self, response):
         if response and len(response["choices"]) > 0:
             ret = response["choices"][0]["message"]["content"]
             # 从输出结果中过滤掉<think>标签内的文字，以免影响后续逻辑
             return re.sub(r"<think>.*</think>", "", ret, flags=re.DOTALL)
         return ""
 
+    def _completion(self, prompt, temperature=0.5, json_mode=False):
+        messages = self._to_messages(prompt)
+        response = self.ollama_chat(
+            messages=messages, temperature=temperature, json_mode=json_mode
+        )
+        return self._parse_response(response)
+
+    async def _acompletion(self, prompt, temperature=0.5, json_mode=False):
+        messages = self._to_messages(prompt)
+        response = await self.aollama_chat(
+            messages=messages, temperature=temperature, json_mode=json_mode
+        )
+        return self._parse_response(response)
+
+
+class BalancedLLMModel(LLMModel):
+    """Balance requests over several endpoints serving the same model"""
+
+    def setup(self, config):
+        self._balance = config.get("balance", {})
+        self._strategy = self._balance.get("strategy", "least_outstanding")
+        self._health_timeout = self._balance.get("health_timeout", 2)
+        self._models = {}
+        for url in self._base_url:
+            m_config = {k: v for k, v in config.items() if k not in ("cache", "cassette", "balance")}
+            m_config["base_url"] = url
+            self._models[url] = create_llm_model(m_config)
+        return None
+
+    def _probing(self, endpoints):
+        probing = [e for e in endpoints if e.expired]
+        for endpoint in probing:
+            # keep it ejected while probing, so other agents skip it
+            endpoint.eject()
+        return probing
+
+    def _choose(self, endpoints):
+        endpoint = pick_endpoint(endpoints, self._strategy)
+        if not endpoint:
+            raise Exception("No healthy endpoint in " + ", ".join(self._models))
+        return endpoint, self._models[endpoint.url]
+
+    def _pick(self):
+        endpoints = [get_endpoint(url, self._balance) for url in self._models]
+        for endpoint in self._probing(endpoints):
+            if self._models[endpoint.url].health_check(self._health_timeout):
+                endpoint.readmit()
+        return self._choose(endpoints)
+
+    async def _apick(self):
+        endpoints = [get_endpoint(url, self._balance) for url in self._models]
+        for endpoint in self._probing(endpoints):
+            # the probe is a blocking request, run it off the event loop
+            healthy = await asyncio.to_thread(
+                self._models[endpoint.url].health_check, self._health_timeout
+            )
+            if healthy:
+                endpoint.readmit()
+        return self._choose(endpoints)
+
+    def _completion(self, prompt, **kwargs):
+        endpoint, model = self._pick()
+        start = endpoint.acquire()
+        try:
+            response = model._completion(prompt, **kwargs)
+        except Exception:
+            endpoint.release(start, failed=True)
+            raise
+        endpoint.release(start)
+        return response
+
+    async def _acompletion(self, prompt, **kwargs):
+        endpoint, model = await self._apick()
+        start = endpoint.acquire()
+        try:
+            response = await model._acompletion(prompt, **kwargs)
+        except Exception:
+            endpoint.release(start, failed=True)
+            raise
+        endpoint.release(start)
+        return response
+
+    def health_check(self, timeout=2):
+        return any(m.health_check(timeout) for m in self._models.values())
+
+    def get_summary(self):
+        summary = super().get_summary()
+        summary["endpoints"] = {
+            url: get_endpoint(url, self._balance).abstract() for url in self._models
+        }
+        return summary
+
+    @property
+    def breaker_key(self):
+        # failing endpoints are ejected one by one instead of breaking the whole pool
+        return None
+
+
+class RoutedLLMModel:
+    """Route prompts to different models by caller name"""
+
+    def __init__(self, config):
+        base_config = {k: v for k, v in config.items() if k != "routes"}
+        self._default = create_llm_model(base_config)
+        self._routes, self._callers = {}, {}
+        for name, route in config["routes"].items():
+            r_config = utils.update_dict(
+                copy.deepcopy(base_config),
+                {k: v for k, v in route.items() if k != "callers"},
+            )
+            self._routes[name] = create_llm_model(r_config)
+            self._callers.update({c: name for c in route.get("callers", [])})
+        self._last = self._default
+
+    def route(self, caller):
+        if caller in self._callers:
+            return self._routes[self._callers[caller]]
+        return self._default
+
+    def completion(self, prompt, caller="llm_normal", **kwargs):
+        self._last = self.route(caller)
+        return self._last.completion(prompt, caller=caller, **kwargs)
+
+    async def acompletion(self, prompt, caller="llm_normal", **kwargs):
+        # meta_responses of async calls are collected per call, keep _last for completion
+        return await self.route(caller).acompletion(prompt, caller=caller, **kwargs)
+
+    def is_available(self):
+        return self._default.is_available()
+
+    def get_summary(self):
+        summary = self._default.get_summary()
+        summary["routes"] = {n: m.get_summary() for n, m in self._routes.items()}
+        return summary
+
+    def disable(self):
+        self._default.disable()
+        for model in self._routes.values():
+            model.disable()
+
+    @property
+    def meta_responses(self):
+        return self._last.meta_responses
+
 
 def create_llm_model(llm_config):
     """Create llm model"""
 
+    if llm_config.get("routes"):
+        return RoutedLLMModel(llm_config)
+
+    base_url = llm_config["base_url"]
+    if isinstance(base_url, list):
+        if len(base_url) > 1:
+            return BalancedLLMModel(llm_config)
+        llm_config = dict(llm_config, base_url=base_url[0])
+
     if llm_config["provider"] == "ollama":
         return OllamaLLMModel(llm_config)
 
@@ -166,3 +583,25 @@ def parse_llm_output(response, patterns, mode="match_last", ignore_empty=False):
     if mode == "match_all":
         return rets
     return None
+
+
+_FULL_WIDTH = str.maketrans(
+    "０１２３４５６７８９［］｛｝", "0123456789[]{}"
+)
+
+
+def repair_llm_output(response):
+    """Clean up format noise of llm output, return None if nothing is changed"""
+
+    text = re.sub(r"<think>.*?</think>", "", response, flags=re.DOTALL)
+    text = re.sub(r"```[a-zA-Z]*", "", text).translate(_FULL_WIDTH)
+    lines = []
+    for line in text.split("\n"):
+        line = re.sub(r"^\s*(?:[-*>]\s+)+", "", line.replace("**", ""))
+        lines.append(line.strip())
+    text = "\n".join(l for l in lines if l)
+    # trailing commas break json parsing
+    text = re.sub(r",\s*([}\]])", r"\1", text)
+    if text == response.strip():
+        return None
+    return text
@@ -0,0 +1,168 @@
+"""generative_agents.model.poignancy"""
+
+import os
+import json
+import math
+import threading
+
+from modules.utils import GenerativeAgentsKey, shared
+
+
+class KeywordEstimator:
+    """Score events containing routine keywords, e.g. {"刷牙": 1}"""
+
+    def __init__(self, keywords=None):
+        self.keywords = keywords or {}
+
+    def estimate(self, describe):
+        for keyword, poignancy in self.keywords.items():
+            if keyword in describe:
+                return poignancy
+        return None
+
+
+class NaiveBayesEstimator:
+    """Char bigram naive bayes classifier trained from the poignancy scored by llm
+
+    Only answers when enough samples are observed and the posterior of the best
+    score reaches confidence. Each description is learned once, so frequent events
+    and cached responses do not skew the counts.
+    """
+
+    def __init__(self, min_samples=50, confidence=0.9):
+        self.min_samples = min_samples
+        self.confidence = confidence
+        self._scores = {}
+        self._features = {}
+        self._totals = {}
+        self._vocab = set()
+        self._samples = 0
+        self._seen = set()
+
+    @staticmethod
+    def featurize(describe):
+        describe = describe.replace(" ", "")
+        return [describe[i : i + 2] for i in range(max(len(describe) - 1, 1))]
+
+    def observe(self, describe, poignancy):
+        if describe in self._seen:
+            return False
+        self._seen.add(describe)
+        key = str(poignancy)
+        self._scores[key] = self._scores.get(key, 0) + 1
+        counts = self._features.setdefault(key, {})
+        for feature in self.featurize(describe):
+            counts[feature] = counts.get(feature, 0) + 1
+            self._vocab.add(feature)
+        self._totals[key] = self._totals.get(key, 0) + len(self.featurize(describe))
+        self._samples += 1
+        return True
+
+    def estimate(self, describe):
+        if self._samples < self.min_samples:
+            return None
+        features, vocab = self.featurize(describe), len(self._vocab) + 1
+        log_probs = {}
+        for key, count in self._scores.items():
+            counts, total = self._features[key], self._totals[key]
+            log_prob = math.log(count / self._samples)
+            for feature in features:
+                log_prob += math.log((counts.get(feature, 0) + 1) / (total + vocab))
+            log_probs[key] = log_prob
+        best = max(log_probs.values())
+        norm = sum(math.exp(p - best) for p in log_probs.values())
+        key = max(log_probs, key=log_probs.get)
+        if 1 / norm < self.confidence:
+            return None
+        return int(key)
+
+    def to_dict(self):
+        return {
+            "scores": self._scores,
+            "features": self._features,
+            "seen": sorted(self._seen),
+        }
+
+    def from_dict(self, data):
+        self._scores = data.get("scores", {})
+        self._features = data.get("features", {})
+        self._totals = {k: sum(v.values()) for k, v in self._features.items()}
+        self._vocab = set(f for v in self._features.values() for f in v)
+        self._samples = sum(self._scores.values())
+        self._seen = set(data.get("seen", []))
+
+
+class PoignancyEstimator:
+    """Local poignancy estimator consulted before the llm, shared by all agents
+
+    Events are first matched with the keyword table, then with the learned
+    classifier; events without a confident answer are deferred to the llm.
+    """
+
+    def __init__(self, keywords=None, learned=True, path=None, min_samples=50, confidence=0.9):
+        self.path = path
+        self._keyword = KeywordEstimator(keywords)
+        self._learned = NaiveBayesEstimator(min_samples, confidence) if learned else None
+        self._summary = {"keyword": 0, "learned": 0, "llm": 0}
+        self._lock = threading.Lock()
+        self._dirty = False
+        if self._learned and path and os.path.exists(path):
+            with open(path, "r", encoding="utf-8") as f:
+                self._learned.from_dict(json.load(f))
+
+    def estimate(self, describe):
+        poignancy = self._keyword.estimate(describe)
+        if poignancy is not None:
+            self._summary["keyword"] += 1
+            return poignancy
+        if self._learned:
+            with self._lock:
+                poignancy = self._learned.estimate(describe)
+            if poignancy is not None:
+                self._summary["learned"] += 1
+                return poignancy
+        return None
+
+    def observe(self, describe, poignancy):
+        """Record a poignancy scored by llm"""
+
+        self._summary["llm"] += 1
+        if self._learned:
+            with self._lock:
+                if self._learned.observe(describe, poignancy):
+                    self._dirty = True
+
+    def save(self):
+        if not self._dirty or not self.path:
+            return
+        with self._lock:
+            data = self._learned.to_dict()
+            self._dirty = False
+        with open(self.path, "w", encoding="utf-8") as f:
+            json.dump(data, f, ensure_ascii=False)
+
+    def abstract(self):
+        total = sum(self._summary.values())
+        bypass = self._summary["keyword"] + self._summary["learned"]
+        return "K:{},L:{},LLM:{},B:{:.2f}".format(
+            self._summary["keyword"],
+            self._summary["learned"],
+            self._summary["llm"],
+            bypass / max(total, 1),
+        )
+
+
+def get_poignancy_estimator(config):
+    """Get the estimator shared by agents with the same path"""
+
+    return shared(
+        GenerativeAgentsKey.ESTIMATORS,
+        config.get("path") or None,
+        lambda path: PoignancyEstimator(
+            keywords=config.get("keywords"),
+            learned=config.get("learned", True),
+            path=path,
+            min_samples=config.get("min_samples", 50),
+            confidence=config.get("confidence", 0.9),
+        ),
+    )
@@ -0,0 +1,103 @@
+"""generative_agents.model.transport"""
+
+import asyncio
+import threading
+import weakref
+import requests
+from requests.adapters import HTTPAdapter
+
+from modules.utils import GenerativeAgentsKey, shared
+
+
+class Transport:
+    """Pooled http transport shared by all llm models"""
+
+    def __init__(self, pool_size=32, keep_alive=True, connect_timeout=10, read_timeout=300):
+        self.pool_size = pool_size
+        self.keep_alive = keep_alive
+        self.timeout = (connect_timeout, read_timeout)
+        self._session = None
+        self._http_client = None
+        self._async_clients = weakref.WeakKeyDictionary()
+        self._lock = threading.Lock()
+
+    @property
+    def session(self):
+        with self._lock:
+            if not self._session:
+                adapter = HTTPAdapter(
+                    pool_connections=self.pool_size, pool_maxsize=self.pool_size
+                )
+                self._session = requests.Session()
+                self._session.mount("http://", adapter)
+                self._session.mount("https://", adapter)
+                if not self.keep_alive:
+                    self._session.headers["Connection"] = "close"
+            return self._session
+
+    @property
+    def http_client(self):
+        with self._lock:
+            if not self._http_client:
+                import httpx
+
+                limits = httpx.Limits(
+                    max_connections=self.pool_size,
+                    max_keepalive_connections=self.pool_size if self.keep_alive else 0,
+                )
+                self._http_client = httpx.Client(
+                    limits=limits,
+                    timeout=httpx.Timeout(self.timeout[1], connect=self.timeout[0]),
+                )
+            return self._http_client
+
+    @property
+    def async_http_client(self):
+        """The async client bound to the running event loop"""
+
+        import httpx
+
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            if loop not in self._async_clients:
+                limits = httpx.Limits(
+                    max_connections=self.pool_size,
+                    max_keepalive_connections=self.pool_size if self.keep_alive else 0,
+                )
+                self._async_clients[loop] = httpx.AsyncClient(
+                    limits=limits,
+                    timeout=httpx.Timeout(self.timeout[1], connect=self.timeout[0]),
+                )
+            return self._async_clients[loop]
+
+    def post(self, url, **kwargs):
+        kwargs.setdefault("timeout", self.timeout)
+        return self.session.post(url, **kwargs)
+
+    def get(self, url, **kwargs):
+        kwargs.setdefault("timeout", self.timeout)
+        return self.session.get(url, **kwargs)
+
+    async def apost(self, url, **kwargs):
+        return await self.async_http_client.post(url, **kwargs)
+
+    def close(self):
+        with self._lock:
+            if self._session:
+                self._session.close()
+            if self._http_client:
+                self._http_client.close()
+            self._session, self._http_client = None, None
+
+
+def get_transport(config=None):
+    """Get the transport shared by models with the same transport config"""
+
+    config = config or {}
+    key = (
+        config.get("pool_size", 32),
+        config.get("keep_alive", True),
+        config.get("connect_timeout", 10),
+        config.get("read_timeout", 300),
+    )
+    return shared(GenerativeAgentsKey.TRANSPORTS, key, lambda k: Transport(*k))
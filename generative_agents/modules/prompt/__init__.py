@@ -1,3 +1,4 @@
 """generative_agents.prompt"""
 
 from .scratch import *
+from .template import *
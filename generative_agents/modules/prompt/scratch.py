@@ -3,31 +3,37 @@
 import random
 import datetime
 import re
-from string import Template
+import json
 
 from modules import utils
 from modules.memory import Event
 from modules.model import parse_llm_output
+from .template import get_prompt_templates
 
 
 class Scratch:
-    def __init__(self, name, currently, config):
+    def __init__(self, name, currently, config, template_path="data/prompts", hot_reload=False):
         self.name = name
         self.currently = currently
         self.config = config
-        self.template_path = "data/prompts"
+        self.template_path = template_path
+        self.templates = get_prompt_templates(template_path, hot_reload)
+        self._base_desc_cache = None
+        self._base_desc_summary = {"hit": 0, "miss": 0}
 
     def build_prompt(self, template, data):
-        with open(f"{self.template_path}/{template}.txt", "r", encoding="utf-8") as file:
-            file_content = file.read()
-
-        template = Template(file_content)
-        filled_content = template.substitute(data)
-
-        return filled_content
+        return self.templates.render(template, data)
 
     def _base_desc(self):
-        return self.build_prompt(
+        # the base description only changes with currently, date or persona config
+        date = utils.get_timer().daily_format_cn()
+        persona = [self.config[k] for k in ("age", "innate", "learned", "lifestyle", "daily_plan")]
+        key = (self.currently, date, persona)
+        if self._base_desc_cache and self._base_desc_cache[0] == key:
+            self._base_desc_summary["hit"] += 1
+            return self._base_desc_cache[1]
+        self._base_desc_summary["miss"] += 1
+        base_desc = self.build_prompt(
             "base_desc",
             {
                 "name": self.name,
@@ -36,10 +42,18 @@ class Scratch:
                 "learned": self.config["learned"],
                 "lifestyle": self.config["lifestyle"],
                 "daily_plan": self.config["daily_plan"],
-                "date": utils.get_timer().daily_format_cn(),
+                "date": date,
                 "currently": self.currently,
             }
         )
+        self._base_desc_cache = (key, base_desc)
+        return base_desc
+
+    def get_summary(self):
+        hit, miss = self._base_desc_summary["hit"], self._base_desc_summary["miss"]
+        return {
+            "base_desc": "H:{},M:{},R:{:.2f}".format(hit, miss, hit / max(hit + miss, 1))
+        }
 
     def prompt_poignancy_event(self, event):
         prompt = self.build_prompt(
@@ -87,6 +101,32 @@ class Scratch:
             "failsafe": random.choice(list(range(10))) + 1,
         }
 
+    def prompt_poignancy_batch(self, events):
+        lines = []
+        for idx, (e_type, event) in enumerate(events):
+            prefix = "对话：" if e_type == "chat" else ""
+            lines.append("{}. {}{}".format(idx + 1, prefix, event.get_describe()))
+        prompt = self.build_prompt(
+            "poignancy_batch",
+            {
+                "base_desc": self._base_desc(),
+                "agent": self.name,
+                "number": len(events),
+                "events": "\n".join(lines),
+            }
+        )
+
+        def _callback(response):
+            pattern = "^(\d+)[\.、:： ].*?评分[:： ]*(\d{1,2})"
+            scores = {
+                int(i): int(s) for i, s in parse_llm_output(response, pattern, "match_all")
+            }
+            assert all(i + 1 in scores for i in range(len(events))), "missing scores"
+            return [min(max(scores[i + 1], 1), 10) for i in range(len(events))]
+
+        # no failsafe, events are scored one by one when batch scoring fails
+        return {"prompt": prompt, "callback": _callback, "failsafe": None}
+
     def prompt_wake_up(self):
         prompt = self.build_prompt(
             "wake_up",
@@ -192,7 +232,28 @@ class Scratch:
             assert len(outputs) >= 5, "less than 5 schedules"
             return {s[0]: s[1] for s in outputs}
 
-        return {"prompt": prompt, "callback": _callback, "failsafe": failsafe}
+        def _repair(response):
+            outputs = re.findall(
+                r"^\W*(\d{1,2})[:：](\d{2})\W*(?:" + self.name + r")?\s*(.+?)。?$",
+                response,
+                flags=re.MULTILINE,
+            )
+            schedule = {f"{int(h)}:{m}": a.strip() for h, m, a in outputs if int(h) < 24}
+            assert len(schedule) >= 3, "less than 3 schedules"
+            # hours missing in the response are taken from failsafe
+            hours = {int(k.split(":")[0]) for k in schedule}
+            for key, activity in failsafe.items():
+                hour = int(key.split(":")[0])
+                if hour >= wake_up and hour not in hours:
+                    schedule[key] = activity
+            return schedule
+
+        return {
+            "prompt": prompt,
+            "callback": _callback,
+            "failsafe": failsafe,
+            "repair": _repair,
+        }
 
     def prompt_schedule_decompose(self, plan, schedule):
         def _plan_des(plan):
@@ -223,14 +284,35 @@ class Scratch:
                 "\d{1,2}\) .*\*计划\* (.*)[\(（]+耗时[:： ]+(\d{1,2})[,， ]+剩余[:： ]+\d*[\)）]",
             ]
             schedules = parse_llm_output(response, patterns, mode="match_all")
-            schedules = [(s[0].strip("."), int(s[1])) for s in schedules]
+            return _fill([(s[0].strip("."), int(s[1])) for s in schedules])
+
+        def _repair(response):
+            outputs = re.findall(
+                r"^(?:\W*\d{1,2}[\)）\.])?(.*?)[\(（]+耗时[:： ]*(\d{1,3})",
+                response,
+                flags=re.MULTILINE,
+            )
+            schedules = []
+            for describe, duration in outputs:
+                describe = re.sub(r".*\*?计划\*?", "", describe).strip(" .。*")
+                if describe and int(duration) > 0:
+                    schedules.append((describe, int(duration)))
+            assert schedules, "Failed to match decomposed schedules"
+            return _fill(schedules)
+
+        def _fill(schedules):
             left = plan["duration"] - sum([s[1] for s in schedules])
             if left > 0:
                 schedules.append((plan["describe"], left))
             return schedules
 
         failsafe = [(plan["describe"], 10) for _ in range(int(plan["duration"] / 10))]
-        return {"prompt": prompt, "callback": _callback, "failsafe": failsafe}
+        return {
+            "prompt": prompt,
+            "callback": _callback,
+            "failsafe": failsafe,
+            "repair": _repair,
+        }
 
     def prompt_schedule_revise(self, action, schedule):
         plan, _ = schedule.current_plan()
@@ -693,6 +775,69 @@ class Scratch:
             "prompt": prompt,
             "callback": _callback,
             "failsafe": "嗯",
+            "structured": True,
+        }
+
+    def prompt_generate_dialogue(self, agent, other, relations, max_turns):
+        def _memory(a, b, relation):
+            focus = [relation, b.get_event().get_describe()]
+            nodes = a.associate.retrieve_focus(focus, 10)
+            return "\n- " + "\n- ".join([n.describe for n in nodes])
+
+        pass_context = ""
+        for n in agent.associate.retrieve_chats(other.name):
+            delta = utils.get_timer().get_delta(n.create)
+            if delta > 480:
+                continue
+            pass_context += f"{delta} 分钟前，{agent.name} 和 {other.name} 进行过对话。{n.describe}\n"
+        if len(pass_context) > 0:
+            prev_context = f'\n背景：\n"""\n{pass_context}"""\n\n'
+        else:
+            prev_context = ""
+        curr_context = (
+            f"{agent.name} {agent.get_event().get_describe(False)} 时，看到 {other.name} {other.get_event().get_describe(False)}。"
+        )
+        address = agent.get_tile().get_address()
+
+        prompt = self.build_prompt(
+            "generate_dialogue",
+            {
+                "agent": agent.name,
+                "base_desc": self._base_desc(),
+                "another": other.name,
+                "another_desc": other.scratch._base_desc(),
+                "relation": relations[0],
+                "another_relation": relations[1],
+                "memory": _memory(agent, other, relations[0]),
+                "another_memory": _memory(other, agent, relations[1]),
+                "address": f"{address[-2]}，{address[-1]}",
+                "current_time": utils.get_timer().get_date("%H:%M"),
+                "previous_context": prev_context,
+                "current_context": curr_context,
+                "max_turns": max_turns,
+            }
+        )
+
+        def _callback(response):
+            assert "{" in response and "}" in response
+            content = json.loads("{" + response.split("{", 1)[1].rsplit("}", 1)[0] + "}")
+            turns = content["dialogue"]
+            chats = []
+            for turn in turns[:max_turns]:
+                (name, text), = turn.items()
+                assert name in (agent.name, other.name), "unknown speaker " + name
+                text = str(text).replace("\n\n", "\n").strip(" \n\"'“”‘’")
+                if text:
+                    chats.append((name, text))
+            assert len(chats) >= 2 and chats[0][0] == agent.name
+            return chats
+
+        # no failsafe, the dialogue is generated turn by turn when parsing fails
+        return {
+            "prompt": prompt,
+            "callback": _callback,
+            "failsafe": None,
+            "structured": True,
         }
 
     def prompt_generate_chat_check_repeat(self, agent, chats, content):
@@ -793,9 +938,28 @@ class Scratch:
                 return insights
             raise Exception("Can not find insights")
 
+        def _repair(response):
+            insights = []
+            for line in response.split("\n"):
+                match = re.match(r"^\s*\d+[\.、\)）\s]+(.+)$", line)
+                if not match:
+                    continue
+                # evidence is optional, insights without it are still kept
+                insight, reason = match.group(1), ""
+                evidence = re.search(r"[\(（]([^\(（]*)[\)）][。\s]*$", insight)
+                if evidence:
+                    insight, reason = insight[: evidence.start()], evidence.group(1)
+                indices = [int(i) for i in re.findall(r"\d+", reason)]
+                node_ids = [nodes[i].node_id for i in indices if i < len(nodes)]
+                if insight.strip(" 。"):
+                    insights.append([insight.strip(" 。"), node_ids])
+            assert insights, "Can not find insights"
+            return insights
+
         return {
             "prompt": prompt,
             "callback": _callback,
+            "repair": _repair,
             "failsafe": [
                 [
                     "{} 在考虑下一步该做什么".format(self.name),
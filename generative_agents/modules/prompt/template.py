@@ -0,0 +1,60 @@
+"""generative_agents.prompt.template"""
+
+import os
+import threading
+from string import Template
+
+from modules.utils import GenerativeAgentsMap, GenerativeAgentsKey
+
+
+class PromptTemplates:
+    """Compiled prompt templates of a folder, loaded once and shared by all agents
+
+    With hot_reload, a template is reloaded when its file is modified.
+    """
+
+    def __init__(self, template_path, hot_reload=False):
+        self.template_path = template_path
+        self.hot_reload = hot_reload
+        self._templates = {}
+        self._lock = threading.Lock()
+        for file in os.listdir(template_path):
+            if file.endswith(".txt"):
+                self._load(file[: -len(".txt")])
+
+    def _load(self, name):
+        path = os.path.join(self.template_path, name + ".txt")
+        mtime = os.path.getmtime(path)
+        with open(path, "r", encoding="utf-8") as f:
+            template = Template(f.read())
+        with self._lock:
+            self._templates[name] = (template, mtime)
+        return template
+
+    def get(self, name):
+        if name not in self._templates:
+            return self._load(name)
+        template, mtime = self._templates[name]
+        if self.hot_reload:
+            path = os.path.join(self.template_path, name + ".txt")
+            if os.path.getmtime(path) != mtime:
+                return self._load(name)
+        return template
+
+    def render(self, name, data):
+        return self.get(name).substitute(data)
+
+
+def get_prompt_templates(template_path, hot_reload=False):
+    """Get the templates shared by agents with the same template_path"""
+
+    templates = GenerativeAgentsMap.get(GenerativeAgentsKey.TEMPLATES)
+    if templates is None:
+        templates = {}
+        GenerativeAgentsMap.set(GenerativeAgentsKey.TEMPLATES, templates)
+    path = os.path.abspath(template_path)
+    if path not in templates:
+        templates[path] = PromptTemplates(path, hot_reload)
+    elif hot_reload:
+        templates[path].hot_reload = True
+    return templates[path]
@@ -0,0 +1,224 @@
+"""generative_agents.storage.embedding"""
+
+import os
+import struct
+import hashlib
+import threading
+from collections import OrderedDict
+from typing import Any, List
+
+import numpy as np
+from llama_index.core.base.embeddings.base import BaseEmbedding
+from llama_index.core.bridge.pydantic import PrivateAttr
+from llama_index.embeddings.ollama import OllamaEmbedding
+
+from modules.utils import GenerativeAgentsKey, shared
+
+
+class EmbeddingCache:
+    """Embeddings shared by agents, evicts least recently used ones by size
+
+    The binary file holds a magic header followed by records of sha1 digest (20 bytes),
+    dimension (uint32) and float32 values. Saves append the records added since the
+    last save, the file is rewritten only when evicted records outnumber live ones.
+    """
+
+    MAGIC = b"GAE2"
+
+    def __init__(self, path=None, max_size=64):
+        self.path = path
+        self.max_size = int(max_size * 1024 * 1024)
+        self._items = OrderedDict()
+        self._size = 0
+        self._summary = {"hit": 0, "miss": 0}
+        self._added = OrderedDict()
+        self._records = 0
+        self._lock = threading.Lock()
+        if path and os.path.exists(path):
+            self._load(path)
+
+    @staticmethod
+    def make_key(model, kind, text):
+        return hashlib.sha1("\n".join([model, kind, text]).encode("utf-8")).digest()
+
+    def get(self, key):
+        with self._lock:
+            embedding = self._items.get(key)
+            if embedding is None:
+                self._summary["miss"] += 1
+                return None
+            self._items.move_to_end(key)
+            self._summary["hit"] += 1
+            return embedding.tolist()
+
+    def set(self, key, embedding):
+        embedding = np.asarray(embedding, dtype=np.float32)
+        with self._lock:
+            self._put(key, embedding)
+            self._added[key] = True
+
+    def _put(self, key, embedding):
+        old = self._items.pop(key, None)
+        if old is not None:
+            self._size -= old.nbytes + len(key)
+        self._items[key] = embedding
+        self._size += embedding.nbytes + len(key)
+        while self._size > self.max_size and self._items:
+            k, e = self._items.popitem(last=False)
+            self._size -= e.nbytes + len(k)
+
+    def _load(self, path):
+        with open(path, "rb") as f:
+            data = f.read()
+        if data[:4] != self.MAGIC:
+            return
+        offset = 4
+        while offset + 24 <= len(data):
+            key, (dim,) = data[offset : offset + 20], struct.unpack_from("<I", data, offset + 20)
+            if offset + 24 + dim * 4 > len(data):
+                break
+            embedding = np.frombuffer(data, dtype="<f4", count=dim, offset=offset + 24)
+            self._put(key, embedding.astype(np.float32))
+            offset += 24 + dim * 4
+            self._records += 1
+        if offset < len(data):
+            # drop a torn tail record of an interrupted save, so appends stay readable
+            with open(path, "r+b") as f:
+                f.truncate(offset)
+
+    @staticmethod
+    def _write_records(f, items):
+        for key, embedding in items:
+            f.write(key + struct.pack("<I", embedding.size))
+            f.write(embedding.astype("<f4").tobytes())
+
+    def save(self):
+        if not self._added or not self.path:
+            return
+        with self._lock:
+            added = [(k, self._items[k]) for k in self._added if k in self._items]
+            self._added.clear()
+            compact = not os.path.exists(self.path) or (
+                self._records + len(added) > 2 * len(self._items) + 1024
+            )
+            items = list(self._items.items()) if compact else added
+        if compact:
+            folder = os.path.dirname(self.path)
+            if folder and not os.path.isdir(folder):
+                os.makedirs(folder)
+            with open(self.path + ".tmp", "wb") as f:
+                f.write(self.MAGIC)
+                self._write_records(f, items)
+            os.replace(self.path + ".tmp", self.path)
+            self._records = len(items)
+        else:
+            with open(self.path, "ab") as f:
+                self._write_records(f, items)
+            self._records += len(items)
+
+    def abstract(self):
+        return "H:{},M:{},S:{}".format(
+            self._summary["hit"], self._summary["miss"], len(self._items)
+        )
+
+
+def get_embedding_cache(config):
+    """Get the embedding cache shared by indexes with the same path"""
+
+    return shared(
+        GenerativeAgentsKey.EMBEDDING_CACHES,
+        config.get("path") or None,
+        lambda path: EmbeddingCache(path, config.get("max_size", 64)),
+    )
+
+
+class CachedEmbedding(BaseEmbedding):
+    """Embedding model looking up the shared cache before calling the wrapped model"""
+
+    _model: Any = PrivateAttr()
+    _cache: Any = PrivateAttr()
+    _name: str = PrivateAttr()
+
+    def __init__(self, model, cache, name, **kwargs: Any) -> None:
+        super().__init__(
+            model_name=model.model_name,
+            embed_batch_size=model.embed_batch_size,
+            **kwargs,
+        )
+        self._model = model
+        self._cache = cache
+        self._name = name
+
+    @classmethod
+    def class_name(cls) -> str:
+        return "CachedEmbedding"
+
+    @property
+    def cache(self):
+        return self._cache
+
+    def _lookup(self, kind, texts):
+        keys = [self._cache.make_key(self._name, kind, t) for t in texts]
+        embeddings = [self._cache.get(k) for k in keys]
+        missing = [i for i, e in enumerate(embeddings) if e is None]
+        return keys, embeddings, missing
+
+    def _update(self, keys, embeddings, missing, computed):
+        for idx, embedding in zip(missing, computed):
+            self._cache.set(keys[idx], embedding)
+            embeddings[idx] = embedding
+        return embeddings
+
+    def _get_query_embedding(self, query: str) -> List[float]:
+        keys, embeddings, missing = self._lookup("query", [query])
+        if missing:
+            computed = [self._model._get_query_embedding(query)]
+            embeddings = self._update(keys, embeddings, missing, computed)
+        return embeddings[0]
+
+    async def _aget_query_embedding(self, query: str) -> List[float]:
+        keys, embeddings, missing = self._lookup("query", [query])
+        if missing:
+            computed = [await self._model._aget_query_embedding(query)]
+            embeddings = self._update(keys, embeddings, missing, computed)
+        return embeddings[0]
+
+    def _get_text_embedding(self, text: str) -> List[float]:
+        return self._get_text_embeddings([text])[0]
+
+    async def _aget_text_embedding(self, text: str) -> List[float]:
+        return (await self._aget_text_embeddings([text]))[0]
+
+    def _get_text_embeddings(self, texts: List[str]) -> List[List[float]]:
+        keys, embeddings, missing = self._lookup("text", texts)
+        if missing:
+            computed = self._model._get_text_embeddings([texts[i] for i in missing])
+            embeddings = self._update(keys, embeddings, missing, computed)
+        return embeddings
+
+    async def _aget_text_embeddings(self, texts: List[str]) -> List[List[float]]:
+        keys, embeddings, missing = self._lookup("text", texts)
+        if missing:
+            computed = await self._model._aget_text_embeddings([texts[i] for i in missing])
+            embeddings = self._update(keys, embeddings, missing, computed)
+        return embeddings
+
+
+class BatchOllamaEmbedding(OllamaEmbedding):
+    """Ollama embedding sending a batch of texts in one request instead of one per text"""
+
+    @classmethod
+    def class_name(cls) -> str:
+        return "BatchOllamaEmbedding"
+
+    def _get_text_embeddings(self, texts: List[str]) -> List[List[float]]:
+        result = self._client.embed(
+            model=self.model_name, input=texts, options=self.ollama_additional_kwargs
+        )
+        return [list(e) for e in result["embeddings"]]
+
+    async def _aget_text_embeddings(self, texts: List[str]) -> List[List[float]]:
+        result = await self._async_client.embed(
+            model=self.model_name, input=texts, options=self.ollama_additional_kwargs
+        )
+        return [list(e) for e in result["embeddings"]]
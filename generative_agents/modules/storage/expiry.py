@@ -0,0 +1,62 @@
+"""generative_agents.storage.expiry"""
+
+import heapq
+
+
+def _stamp(date_str):
+    # "%Y%m%d-%H:%M:%S" as an integer keeps the order without parsing dates
+    return int(date_str.replace("-", "").replace(":", ""))
+
+
+class ExpiryIndex:
+    """Heaps of node expire and create times, so cleanup only visits stale nodes
+
+    Removed nodes are dropped lazily: heap entries that no longer match the tracked
+    times are skipped when popped.
+    """
+
+    def __init__(self):
+        self._times = {}
+        self._expire = []
+        self._create = []
+
+    def add(self, node_id, metadata):
+        if "create" not in metadata or "expire" not in metadata:
+            return
+        create, expire = _stamp(metadata["create"]), _stamp(metadata["expire"])
+        self._times[node_id] = (create, expire)
+        heapq.heappush(self._expire, (expire, node_id))
+        heapq.heappush(self._create, (-create, node_id))
+        if max(len(self._expire), len(self._create)) > 2 * len(self._times) + 64:
+            self._rebuild()
+
+    def remove(self, node_id):
+        self._times.pop(node_id, None)
+
+    def stale(self, date_str):
+        """Pop the nodes expired before or created after date_str"""
+
+        now, node_ids = _stamp(date_str), []
+        while self._expire and self._expire[0][0] < now:
+            expire, node_id = heapq.heappop(self._expire)
+            times = self._times.get(node_id)
+            if times and times[1] == expire:
+                node_ids.append(node_id)
+                self._times.pop(node_id)
+        while self._create and -self._create[0][0] > now:
+            create, node_id = heapq.heappop(self._create)
+            times = self._times.get(node_id)
+            if times and times[0] == -create:
+                node_ids.append(node_id)
+                self._times.pop(node_id)
+        return node_ids
+
+    def _rebuild(self):
+        # drop entries of removed nodes once they outnumber the live ones
+        self._expire = [(e, n) for n, (_, e) in self._times.items()]
+        self._create = [(-c, n) for n, (c, _) in self._times.items()]
+        heapq.heapify(self._expire)
+        heapq.heapify(self._create)
+
+    def __len__(self):
+        return len(self._times)
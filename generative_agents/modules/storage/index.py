@@ -2,16 +2,21 @@
 
 import os
 import time
+import threading
+from collections import OrderedDict
 from llama_index.embeddings.huggingface import HuggingFaceEmbedding
 from llama_index.core.indices.vector_store.retrievers import VectorIndexRetriever
 from llama_index.core.schema import TextNode
 from llama_index import core as index_core
-from llama_index.embeddings.ollama import OllamaEmbedding
 from llama_index.embeddings.openai import OpenAIEmbedding
 from llama_index.core.node_parser import SentenceSplitter
 from llama_index.core import Settings
 
 from modules import utils
+from .embedding import BatchOllamaEmbedding, CachedEmbedding, get_embedding_cache
+from .expiry import ExpiryIndex
+from .vector_store import NumpyVectorStore
+from .wal import IndexLog
 
 
 class LlamaIndex:
@@ -20,7 +25,7 @@ class LlamaIndex:
         if embedding_config["provider"] == "hugging_face":
             embed_model = HuggingFaceEmbedding(model_name=embedding_config["model"])
         elif embedding_config["provider"] == "ollama":
-            embed_model = OllamaEmbedding(
+            embed_model = BatchOllamaEmbedding(
                 model_name=embedding_config["model"],
                 base_url=embedding_config["base_url"],
                 ollama_additional_kwargs={"mirostat": 0},
@@ -36,19 +41,69 @@ class LlamaIndex:
                 "embedding provider {} is not supported".format(embedding_config["provider"])
             )
 
+        if embedding_config.get("batch_size"):
+            embed_model.embed_batch_size = embedding_config["batch_size"]
+        if embedding_config.get("cache"):
+            self._embedding_cache = get_embedding_cache(embedding_config["cache"])
+            embed_model = CachedEmbedding(
+                embed_model,
+                self._embedding_cache,
+                "{}:{}".format(embedding_config["provider"], embedding_config["model"]),
+            )
+        else:
+            self._embedding_cache = None
         Settings.embed_model = embed_model
         Settings.node_parser = SentenceSplitter(chunk_size=512, chunk_overlap=64)
         Settings.num_output = 1024
         Settings.context_window = 4096
+        # float16 halves the embedding files, with slightly less precise similarity
+        vector_dtype = embedding_config.get("vector_dtype", "float32")
         if path and os.path.exists(path):
+            vector_store = NumpyVectorStore.from_persist_path(
+                os.path.join(path, "default__vector_store.json"), dtype=vector_dtype
+            )
             self._index = index_core.load_index_from_storage(
-                index_core.StorageContext.from_defaults(persist_dir=path),
+                index_core.StorageContext.from_defaults(
+                    persist_dir=path, vector_store=vector_store
+                ),
                 show_progress=True,
             )
             self._config = utils.load_dict(os.path.join(path, "index_config.json"))
+            self._snapshot = path
         else:
-            self._index = index_core.VectorStoreIndex([], show_progress=True)
+            self._index = index_core.VectorStoreIndex(
+                [],
+                storage_context=index_core.StorageContext.from_defaults(
+                    vector_store=NumpyVectorStore(dtype=vector_dtype)
+                ),
+                show_progress=True,
+            )
+            self._snapshot = None
         self._path = path
+        # with wal on, saves append changes to a log and compact it into a snapshot
+        self._wal_config = embedding_config.get("wal")
+        self._changes = []
+        log_path = os.path.join(path, "index_wal.jsonl") if path else None
+        # a log left with wal off is still replayed, then compacted on the first save
+        if log_path and (self._wal_config or os.path.exists(log_path)):
+            self._log = IndexLog(log_path)
+            if self._snapshot:
+                self._replay()
+        else:
+            self._log = None
+        self._expiry = ExpiryIndex()
+        for node_id, metadata in self._index.vector_store.metadata.items():
+            self._expiry.add(node_id, metadata)
+        # nodes added with buffer on are embedded in one batch at flush
+        self._buffer = embedding_config.get("buffer", False)
+        self._pending = OrderedDict()
+        self._lock = threading.RLock()
+        # retry until success by default, as nodes can not be dropped silently
+        self._retry = utils.RetryPolicy.from_config(
+            embedding_config.get("retry"),
+            breaker_key=embedding_config.get("base_url"),
+            retry=-1,
+        )
 
     def add_node(
         self,
@@ -58,30 +113,75 @@ class LlamaIndex:
         exclude_embedding_keys=None,
         id=None,
     ):
+        node = self._make_node(text, metadata, exclude_llm_keys, exclude_embedding_keys, id)
+        self._add([node], "add_node")
+        return node
+
+    def add_nodes(self, items):
+        """Add nodes from (text, metadata) pairs, embeddings are computed in one batch"""
+
+        nodes = [self._make_node(text, metadata) for text, metadata in items]
+        if nodes:
+            self._add(nodes, "add_nodes")
+        return nodes
+
+    def _add(self, nodes, caller):
+        if not self._buffer:
+            self._insert_nodes(nodes, caller)
+            return
+        with self._lock:
+            self._pending.update({n.id_: n for n in nodes})
+
+    def flush(self):
+        """Embed and insert the buffered nodes"""
+
+        with self._lock:
+            if self._pending:
+                self._insert_nodes(list(self._pending.values()), "flush")
+                self._pending.clear()
+
+    def _make_node(
+        self,
+        text,
+        metadata=None,
+        exclude_llm_keys=None,
+        exclude_embedding_keys=None,
+        id=None,
+    ):
+        metadata = metadata or {}
+        exclude_llm_keys = exclude_llm_keys or list(metadata.keys())
+        exclude_embedding_keys = exclude_embedding_keys or list(metadata.keys())
+        id = id or "node_" + str(self._config["max_nodes"])
+        self._config["max_nodes"] += 1
+        return TextNode(
+            text=text,
+            id_=id,
+            metadata=metadata,
+            excluded_llm_metadata_keys=exclude_llm_keys,
+            excluded_embed_metadata_keys=exclude_embedding_keys,
+        )
+
+    def _insert_nodes(self, nodes, caller):
+        retrying = self._retry.start(caller)
         while True:
             try:
-                metadata = metadata or {}
-                exclude_llm_keys = exclude_llm_keys or list(metadata.keys())
-                exclude_embedding_keys = exclude_embedding_keys or list(metadata.keys())
-                id = id or "node_" + str(self._config["max_nodes"])
-                self._config["max_nodes"] += 1
-                node = TextNode(
-                    text=text,
-                    id_=id,
-                    metadata=metadata,
-                    excluded_llm_metadata_keys=exclude_llm_keys,
-                    excluded_embed_metadata_keys=exclude_embedding_keys,
-                )
-                self._index.insert_nodes([node])
-                return node
+                self._index.insert_nodes(nodes)
+                retrying.succeed()
+                if self._log:
+                    self._changes.append(("add", [n.id_ for n in nodes]))
+                for node in nodes:
+                    self._expiry.add(node.id_, node.metadata)
+                return
             except Exception as e:
-                print(f"LlamaIndex.add_node() caused an error: {e}")
-                time.sleep(5)
+                print(f"LlamaIndex.{caller}() caused an error: {e}")
+                self._wait(retrying)
 
     def has_node(self, node_id):
-        return node_id in self._index.docstore.docs
+        return node_id in self._pending or node_id in self._index.docstore.docs
 
     def find_node(self, node_id):
+        if node_id in self._pending:
+            return self._pending[node_id]
         return self._index.docstore.docs[node_id]
 
     def get_nodes(self, filter=None):
@@ -90,18 +190,22 @@ class LlamaIndex:
                 return True
             return filter(node)
 
+        self.flush()
         return [n for n in self._index.docstore.docs.values() if _check(n)]
 
     def remove_nodes(self, node_ids, delete_from_docstore=True):
+        with self._lock:
+            node_ids = [n for n in node_ids if self._pending.pop(n, None) is None]
         self._index.delete_nodes(node_ids, delete_from_docstore=delete_from_docstore)
+        for node_id in node_ids:
+            self._expiry.remove(node_id)
+        if self._log and node_ids:
+            self._changes.append(("delete", node_ids))
 
     def cleanup(self):
-        now, remove_ids = utils.get_timer().get_date(), []
-        for node_id, node in self._index.docstore.docs.items():
-            create = utils.to_date(node.metadata["create"])
-            expire = utils.to_date(node.metadata["expire"])
-            if create > now or expire < now:
-                remove_ids.append(node_id)
+        self.flush()
+        now = utils.get_timer().get_date("%Y%m%d-%H:%M:%S")
+        remove_ids = self._expiry.stale(now)
         self.remove_nodes(remove_ids)
         return remove_ids
 
@@ -113,6 +217,7 @@ class LlamaIndex:
         node_ids=None,
         retriever_creator=None,
     ):
+        self.flush()
         try:
             retriever_creator = retriever_creator or VectorIndexRetriever
             return retriever_creator(
@@ -140,22 +245,89 @@ class LlamaIndex:
             "refine_template": refine_template,
             "filters": filters,
         }
+        self.flush()
+        retrying = self._retry.start("query")
         while True:
             try:
                 if query_creator:
                     query_engine = query_creator(retriever=self._index.as_retriever(**kwargs))
                 else:
                     query_engine = self._index.as_query_engine(**kwargs)
-                return query_engine.query(text)
+                response = query_engine.query(text)
+                retrying.succeed()
+                return response
             except Exception as e:
                 print(f"LlamaIndex.query() caused an error: {e}")
-                time.sleep(5)
+                self._wait(retrying)
+
+    def _wait(self, retrying):
+        delay = retrying.fail()
+        if delay is None:
+            raise TimeoutError("LlamaIndex gave up retrying")
+        time.sleep(delay)
 
     def save(self, path=None):
         path = path or self._path
-        self._index.storage_context.persist(path)
+        self.flush()
+        if self._log and path == self._path and not self._compact_due():
+            self._log.append(self._log_records())
+        else:
+            self._index.storage_context.persist(path)
+            if self._log and path == self._path:
+                self._log.reset()
+                self._snapshot = path
+                if not self._wal_config:
+                    self._log = None
+        if path == self._path:
+            # changes saved elsewhere are still due to the log of self._path
+            self._changes = []
+        if self._embedding_cache:
+            self._embedding_cache.save()
         utils.save_dict(self._config, os.path.join(path, "index_config.json"))
 
+    def _compact_due(self):
+        if not self._snapshot or not self._wal_config:
+            return True
+        # compact once the log outgrows a ratio of the index, so total io stays linear
+        threshold = max(
+            self._wal_config.get("compact_min", 256),
+            self._wal_config.get("compact_ratio", 0.5) * self.nodes_num,
+        )
+        return self._log.records >= threshold
+
+    def _log_records(self):
+        records = []
+        docstore, vector_store = self._index.docstore, self._index.vector_store
+        for op, node_ids in self._changes:
+            if op == "delete":
+                records.append(IndexLog.delete_record(node_ids))
+                continue
+            for node_id in node_ids:
+                node = docstore.get_document(node_id, raise_error=False)
+                if node is not None:
+                    records.append(IndexLog.add_record(node, vector_store.get(node_id)))
+        return records
+
+    def _replay(self):
+        adds = []
+        for op, value in self._log.replay():
+            if op == "add":
+                adds.append(value)
+                continue
+            if adds:
+                self._index.insert_nodes(adds)
+                adds = []
+            # nodes added and deleted between two saves are not in the log
+            nodes_dict = self._index.index_struct.nodes_dict
+            node_ids = [n for n in value if n in nodes_dict]
+            self._index.delete_nodes(node_ids, delete_from_docstore=True)
+        if adds:
+            self._index.insert_nodes(adds)
+
+    @property
+    def embedding_cache(self):
+        return self._embedding_cache
+
     @property
     def nodes_num(self):
-        return len(self._index.docstore.docs)
+        return len(self._index.docstore.docs) + len(self._pending)
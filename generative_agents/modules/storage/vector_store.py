@@ -0,0 +1,271 @@
+"""generative_agents.storage.vector_store"""
+
+import os
+import glob
+import json
+from typing import Any, List, Optional, Sequence
+
+import numpy as np
+from llama_index.core.bridge.pydantic import PrivateAttr
+from llama_index.core.schema import BaseNode
+from llama_index.core.vector_stores.simple import _build_metadata_filter_fn
+from llama_index.core.vector_stores.types import (
+    BasePydanticVectorStore,
+    MetadataFilters,
+    VectorStoreQuery,
+    VectorStoreQueryResult,
+)
+
+
+class NumpyVectorStore(BasePydanticVectorStore):
+    """Vector store keeping normalized embeddings in a contiguous float32 matrix
+
+    Rows are kept dense, removed rows are filled with the last row. Similarity is
+    cosine as in SimpleVectorStore, computed as one matrix-vector product.
+    Persisted rows are memory-mapped on load and read lazily, rows added later are
+    kept in memory. Each persist writes a new matrix file named in the json, so a
+    mapped file is never written or replaced.
+    """
+
+    stores_text: bool = False
+
+    _base: Any = PrivateAttr()
+    _matrix: Any = PrivateAttr()
+    _dtype: str = PrivateAttr()
+    _generation: int = PrivateAttr()
+    _ids: List[str] = PrivateAttr()
+    _rows: dict = PrivateAttr()
+    _metadata: dict = PrivateAttr()
+    _ref_docs: dict = PrivateAttr()
+
+    def __init__(self, dim=0, dtype="float32", **kwargs: Any) -> None:
+        super().__init__(**kwargs)
+        self._base = np.zeros((0, dim), dtype=np.float32)
+        self._matrix = np.zeros((16, dim), dtype=np.float32)
+        self._dtype = dtype
+        self._generation = 0
+        self._ids, self._rows = [], {}
+        self._metadata, self._ref_docs = {}, {}
+
+    @classmethod
+    def class_name(cls) -> str:
+        return "NumpyVectorStore"
+
+    @property
+    def client(self) -> None:
+        return None
+
+    @property
+    def size(self):
+        return len(self._ids)
+
+    @property
+    def metadata(self):
+        return self._metadata
+
+    def _read(self, row):
+        base_num = len(self._base)
+        if row < base_num:
+            return self._base[row]
+        return self._matrix[row - base_num]
+
+    def _write(self, row, embedding):
+        base_num = len(self._base)
+        if row < base_num:
+            # copy-on-write mapping, changes stay in memory
+            self._base[row] = embedding
+            return
+        row -= base_num
+        if row >= self._matrix.shape[0]:
+            grown = np.zeros((max(row * 2, 16), self._matrix.shape[1]), dtype=np.float32)
+            grown[: self._matrix.shape[0]] = self._matrix
+            self._matrix = grown
+        self._matrix[row] = embedding
+
+    def get(self, text_id: str) -> List[float]:
+        return self._read(self._rows[text_id]).astype(np.float32).tolist()
+
+    def add(self, nodes: Sequence[BaseNode], **add_kwargs: Any) -> List[str]:
+        if not nodes:
+            return []
+        embeddings = np.asarray([n.get_embedding() for n in nodes], dtype=np.float32)
+        self._append(
+            [n.node_id for n in nodes],
+            embeddings,
+            [dict(n.metadata) for n in nodes],
+            [n.ref_doc_id or "None" for n in nodes],
+        )
+        return [n.node_id for n in nodes]
+
+    def _append(self, ids, embeddings, metadata, ref_docs):
+        norms = np.linalg.norm(embeddings, axis=1, keepdims=True)
+        embeddings = embeddings / np.maximum(norms, 1e-12)
+        if self._matrix.shape[1] != embeddings.shape[1]:
+            # first insert fixes the dimension
+            assert not self._ids, "Embedding dimension changed"
+            self._base = np.zeros((0, embeddings.shape[1]), dtype=np.float32)
+            self._matrix = np.zeros((16, embeddings.shape[1]), dtype=np.float32)
+        for node_id, embedding, meta, ref_doc in zip(ids, embeddings, metadata, ref_docs):
+            row = self._rows.get(node_id)
+            if row is None:
+                row = len(self._ids)
+                self._ids.append(node_id)
+                self._rows[node_id] = row
+            self._write(row, embedding)
+            self._metadata[node_id] = meta
+            self._ref_docs[node_id] = ref_doc
+
+    def _remove(self, node_ids):
+        for node_id in node_ids:
+            row = self._rows.pop(node_id, None)
+            if row is None:
+                continue
+            last = len(self._ids) - 1
+            if row != last:
+                self._write(row, self._read(last))
+                self._ids[row] = self._ids[last]
+                self._rows[self._ids[row]] = row
+            self._ids.pop()
+            self._metadata.pop(node_id, None)
+            self._ref_docs.pop(node_id, None)
+
+    def delete(self, ref_doc_id: str, **delete_kwargs: Any) -> None:
+        self._remove([i for i, r in self._ref_docs.items() if r == ref_doc_id])
+
+    def delete_nodes(
+        self,
+        node_ids: Optional[List[str]] = None,
+        filters: Optional[MetadataFilters] = None,
+        **delete_kwargs: Any,
+    ) -> None:
+        candidates = list(self._ids) if node_ids is None else node_ids
+        if filters:
+            filter_fn = _build_metadata_filter_fn(lambda i: self._metadata[i], filters)
+            candidates = [i for i in candidates if i in self._rows and filter_fn(i)]
+        self._remove(candidates)
+
+    def clear(self) -> None:
+        self._remove(list(self._ids))
+
+    def query(self, query: VectorStoreQuery, **kwargs: Any) -> VectorStoreQueryResult:
+        if query.node_ids is not None:
+            ids = [i for i in query.node_ids if i in self._rows]
+        else:
+            ids = self._ids
+        if query.filters is not None:
+            filter_fn = _build_metadata_filter_fn(lambda i: self._metadata[i], query.filters)
+            ids = [i for i in ids if filter_fn(i)]
+        if not ids or query.query_embedding is None:
+            return VectorStoreQueryResult(similarities=[], ids=[])
+        q_emb = np.asarray(query.query_embedding, dtype=np.float32)
+        q_emb = q_emb / max(float(np.linalg.norm(q_emb)), 1e-12)
+        if ids is self._ids:
+            scores = self._scores(np.arange(len(ids)), q_emb)
+        else:
+            rows = np.fromiter((self._rows[i] for i in ids), dtype=np.int64, count=len(ids))
+            scores = self._scores(rows, q_emb)
+        top_k = min(query.similarity_top_k, len(ids))
+        if top_k < len(ids):
+            top = np.argpartition(-scores, top_k - 1)[:top_k]
+        else:
+            top = np.arange(len(ids))
+        top = top[np.argsort(-scores[top], kind="stable")]
+        return VectorStoreQueryResult(
+            similarities=scores[top].tolist(), ids=[ids[i] for i in top]
+        )
+
+    def _scores(self, rows, q_emb):
+        base_num = len(self._base)
+        in_base = rows < base_num
+        if in_base.all():
+            return self._base[rows] @ q_emb
+        scores = np.empty(len(rows), dtype=np.float32)
+        scores[in_base] = self._base[rows[in_base]] @ q_emb
+        scores[~in_base] = self._matrix[rows[~in_base] - base_num] @ q_emb
+        return scores
+
+    def persist(self, persist_path: str, fs: Optional[Any] = None) -> None:
+        folder = os.path.dirname(persist_path)
+        if folder and not os.path.isdir(folder):
+            os.makedirs(folder)
+        base_num = min(len(self._base), self.size)
+        matrix = np.concatenate(
+            [self._base[:base_num], self._matrix[: self.size - base_num]]
+        ).astype(self._dtype)
+        # write a new generation, the mapped one may still be read by this store
+        self._generation += 1
+        matrix_path = self._matrix_path(persist_path, self._generation)
+        np.save(matrix_path, matrix)
+        data = {
+            "ids": self._ids,
+            "metadata": self._metadata,
+            "ref_docs": self._ref_docs,
+            "matrix": os.path.basename(matrix_path),
+        }
+        # the json is replaced last, a crash before it keeps the previous snapshot
+        with open(persist_path + ".tmp", "w", encoding="utf-8") as f:
+            json.dump(data, f, ensure_ascii=False)
+        os.replace(persist_path + ".tmp", persist_path)
+        # map the new generation to release the old one, then remove the old files
+        if self.size:
+            self._base = np.load(matrix_path, mmap_mode="c")
+        else:
+            self._base = np.zeros((0, matrix.shape[1]), dtype=np.float32)
+        self._matrix = np.zeros((16, matrix.shape[1]), dtype=np.float32)
+        self._remove_generations(persist_path, matrix_path)
+
+    @staticmethod
+    def _matrix_path(persist_path, generation=None):
+        stem = os.path.splitext(persist_path)[0]
+        if generation is None:
+            # checkpoints before generations
+            return stem + ".npy"
+        return "{}.{}.npy".format(stem, generation)
+
+    @staticmethod
+    def _remove_generations(persist_path, keep):
+        stem = glob.escape(os.path.splitext(persist_path)[0])
+        for path in glob.glob(stem + ".npy") + glob.glob(stem + ".*.npy"):
+            if os.path.abspath(path) == os.path.abspath(keep):
+                continue
+            try:
+                os.remove(path)
+            except OSError:
+                # still mapped somewhere on windows, removed by a later persist
+                pass
+
+    @classmethod
+    def from_persist_path(
+        cls, persist_path: str, fs: Optional[Any] = None, dtype="float32"
+    ) -> "NumpyVectorStore":
+        store = cls(dtype=dtype)
+        if not os.path.exists(persist_path):
+            return store
+        with open(persist_path, "r", encoding="utf-8") as f:
+            data = json.load(f)
+        if "embedding_dict" in data:
+            # converted from SimpleVectorStore
+            ids = list(data["embedding_dict"].keys())
+            if ids:
+                store._append(
+                    ids,
+                    np.asarray([data["embedding_dict"][i] for i in ids], dtype=np.float32),
+                    [(data.get("metadata_dict") or {}).get(i, {}) for i in ids],
+                    [data.get("text_id_to_ref_doc_id", {}).get(i, "None") for i in ids],
+                )
+            return store
+        if not data["ids"]:
+            return store
+        # rows are normalized already, map them without reading
+        if data.get("matrix"):
+            matrix_path = os.path.join(os.path.dirname(persist_path), data["matrix"])
+            store._generation = int(data["matrix"].split(".")[-2])
+        else:
+            matrix_path = cls._matrix_path(persist_path)
+        base = np.load(matrix_path, mmap_mode="c")
+        store._base = base
+        store._matrix = np.zeros((16, base.shape[1]), dtype=np.float32)
+        store._ids = data["ids"]
+        store._rows = {node_id: row for row, node_id in enumerate(store._ids)}
+        store._metadata, store._ref_docs = data["metadata"], data["ref_docs"]
+        return store
@@ -0,0 +1,83 @@
+"""generative_agents.storage.wal"""
+
+import os
+import json
+import base64
+
+import numpy as np
+from llama_index.core.storage.docstore.utils import doc_to_json, json_to_doc
+
+
+class IndexLog:
+    """Append-only log of node inserts and deletes since the last index snapshot
+
+    Each line is {"op": "add", "node": <node json>, "embedding": <base64 float32>}
+    or {"op": "delete", "ids": [<node_id>]}.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.records = 0
+        if os.path.exists(path):
+            self._repair()
+
+    def _repair(self):
+        # drop a torn tail line of an interrupted save, so later records are kept
+        valid = 0
+        with open(self.path, "rb") as f:
+            for line in f:
+                if not line.endswith(b"\n"):
+                    break
+                try:
+                    json.loads(line)
+                except ValueError:
+                    break
+                valid += len(line)
+                self.records += 1
+        if valid < os.path.getsize(self.path):
+            with open(self.path, "r+b") as f:
+                f.truncate(valid)
+
+    def append(self, records):
+        if not records:
+            return
+        with open(self.path, "a", encoding="utf-8") as f:
+            for record in records:
+                f.write(json.dumps(record, ensure_ascii=False) + "\n")
+        self.records += len(records)
+
+    def replay(self):
+        """Yield ("add", node) with embedding set and ("delete", node_ids) in order"""
+
+        if not os.path.exists(self.path):
+            return
+        with open(self.path, "r", encoding="utf-8") as f:
+            for line in f:
+                record = json.loads(line)
+                if record["op"] == "add":
+                    node = json_to_doc(record["node"])
+                    embedding = np.frombuffer(
+                        base64.b64decode(record["embedding"]), dtype="<f4"
+                    )
+                    node.embedding = embedding.tolist()
+                    yield "add", node
+                elif record["op"] == "delete":
+                    yield "delete", record["ids"]
+
+    def reset(self):
+        if os.path.exists(self.path):
+            os.remove(self.path)
+        self.records = 0
+
+    @staticmethod
+    def add_record(node, embedding):
+        embedding = np.asarray(embedding, dtype="<f4").tobytes()
+        return {
+            "op": "add",
+            "node": doc_to_json(node),
+            "embedding": base64.b64encode(embedding).decode("ascii"),
+        }
+
+    @staticmethod
+    def delete_record(node_ids):
+        return {"op": "delete", "ids": list(node_ids)}
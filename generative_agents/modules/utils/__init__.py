@@ -1,6 +1,9 @@
 """generative_agents.utils"""
 
+from .aio import *
 from .arguments import *
 from .log import *
 from .namespace import *
+from .retry import *
+from .text import *
 from .timer import *
@@ -0,0 +1,42 @@
+"""generative_agents.utils.aio"""
+
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from .namespace import GenerativeAgentsMap, GenerativeAgentsKey
+
+_LOCAL = threading.local()
+
+
+def get_event_loop():
+    """Get the persistent event loop of current thread"""
+
+    loop = getattr(_LOCAL, "loop", None)
+    if loop is None or loop.is_closed():
+        loop = asyncio.new_event_loop()
+        _LOCAL.loop = loop
+    return loop
+
+
+def run_async(*coros):
+    """Run coroutines concurrently from sync code and return their results in order
+
+    The loop is kept alive between calls, so async clients and their pooled
+    connections can be reused across simulation steps.
+    """
+
+    async def _gather():
+        return await asyncio.gather(*coros)
+
+    return get_event_loop().run_until_complete(_gather())
+
+
+def get_executor(max_workers=4):
+    """Get the thread pool shared by background jobs, e.g. deferred reflections"""
+
+    executor = GenerativeAgentsMap.get(GenerativeAgentsKey.EXECUTOR)
+    if executor is None:
+        executor = ThreadPoolExecutor(max_workers, thread_name_prefix="background")
+        GenerativeAgentsMap.set(GenerativeAgentsKey.EXECUTOR, executor)
+    return executor
@@ -1,6 +1,7 @@
 """generative_agents.utils.namespace"""
 
-from typing import Any, Optional
+from typing import Any, Callable, Hashable, Optional
+import os
 import copy
 
 
@@ -42,3 +43,30 @@ class GenerativeAgentsKey:
     GAME = "game"
     TIMER = "timer"
     MODELS = "models"
+    TRANSPORTS = "transports"
+    LLM_CACHES = "llm_caches"
+    BREAKERS = "breakers"
+    ENDPOINTS = "endpoints"
+    CASSETTES = "cassettes"
+    TEMPLATES = "templates"
+    ESTIMATORS = "estimators"
+    MEMO_CACHES = "memo_caches"
+    EXECUTOR = "executor"
+    EMBEDDING_CACHES = "embedding_caches"
+
+
+def shared(key: str, name: Hashable, factory: Callable[[Hashable], Any]):
+    """Get the object registered under key for name, created by factory(name) once
+
+    Path names are made absolute so relative and absolute paths share the object.
+    """
+
+    objects = GenerativeAgentsMap.get(key)
+    if objects is None:
+        objects = {}
+        GenerativeAgentsMap.set(key, objects)
+    if isinstance(name, str):
+        name = os.path.abspath(name)
+    if name not in objects:
+        objects[name] = factory(name)
+    return objects[name]
@@ -0,0 +1,166 @@
+"""generative_agents.utils.retry"""
+
+import time
+import random
+import threading
+
+from .namespace import GenerativeAgentsMap, GenerativeAgentsKey
+
+
+class CircuitBreaker:
+    """Open after continuous failures, let a probe request through after reset_timeout"""
+
+    def __init__(self, failure_threshold=5, reset_timeout=30):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self._failures = 0
+        self._opened_at = None
+        self._probing = False
+        self._lock = threading.Lock()
+
+    def allow(self):
+        with self._lock:
+            if self._opened_at is None:
+                return True
+            if self._probing or self.remaining() > 0:
+                return False
+            # half open: let one request probe the endpoint
+            self._probing = True
+            return True
+
+    def remaining(self):
+        if self._opened_at is None:
+            return 0
+        return max(self._opened_at + self.reset_timeout - time.time(), 0)
+
+    def record_success(self):
+        with self._lock:
+            self._failures, self._opened_at, self._probing = 0, None, False
+
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            if self._probing or self._failures >= self.failure_threshold:
+                self._opened_at = time.time()
+            self._probing = False
+
+    @property
+    def state(self):
+        if self._opened_at is None:
+            return "closed"
+        return "half_open" if self.remaining() == 0 else "open"
+
+
+class RetryPolicy:
+    """Exponential backoff with jitter, deadlines and a circuit breaker
+
+    retry < 0 means retrying until success or deadline.
+    """
+
+    def __init__(
+        self,
+        retry=4,
+        base_delay=1,
+        max_delay=30,
+        multiplier=2,
+        jitter=0.5,
+        deadline=None,
+        deadlines=None,
+        breaker=None,
+    ):
+        self.retry = retry
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.multiplier = multiplier
+        self.jitter = jitter
+        self.deadline = deadline
+        self.deadlines = deadlines or {}
+        self.breaker = breaker
+
+    def backoff(self, attempt):
+        delay = min(self.base_delay * self.multiplier ** attempt, self.max_delay)
+        return delay * (1 - self.jitter * random.random())
+
+    def start(self, caller=None, retry=None, deadline=None):
+        if deadline is None:
+            deadline = self.deadlines.get(caller, self.deadline)
+        return RetryState(self, self.retry if retry is None else retry, deadline)
+
+    @classmethod
+    def from_config(cls, config=None, breaker_key=None, **kwargs):
+        config = dict(config or {})
+        breaker = None
+        if breaker_key:
+            breaker = get_circuit_breaker(
+                breaker_key,
+                config.pop("failure_threshold", 5),
+                config.pop("reset_timeout", 30),
+            )
+        else:
+            config.pop("failure_threshold", None)
+            config.pop("reset_timeout", None)
+        kwargs.update(config)
+        return cls(breaker=breaker, **kwargs)
+
+
+class RetryState:
+    """Attempts of a single call under RetryPolicy"""
+
+    def __init__(self, policy, retry, deadline=None):
+        self._policy = policy
+        self._retry = retry
+        self._end = time.time() + deadline if deadline else None
+        self.attempt = 0
+
+    def allow(self):
+        if 0 <= self._retry <= self.attempt:
+            return False
+        if self._end and time.time() >= self._end:
+            return False
+        breaker = self._policy.breaker
+        if not breaker or self._retry < 0:
+            # unlimited retries wait for the breaker in fail() instead of failing fast
+            return True
+        return breaker.allow()
+
+    def succeed(self):
+        if self._policy.breaker:
+            self._policy.breaker.record_success()
+
+    def fail(self, endpoint=True):
+        """Record a failed attempt, return the delay before next attempt or None to give up
+
+        Set endpoint to False if the endpoint responded but the response is unusable.
+        """
+
+        self.attempt += 1
+        breaker = self._policy.breaker
+        if breaker and endpoint:
+            breaker.record_failure()
+        if 0 <= self._retry <= self.attempt:
+            return None
+        if not endpoint:
+            return 0
+        delay = self._policy.backoff(self.attempt - 1)
+        if breaker and breaker.remaining() > 0:
+            if self._retry >= 0:
+                return None
+            delay = max(delay, breaker.remaining())
+        if self._end:
+            left = self._end - time.time()
+            if left <= 0:
+                return None
+            delay = min(delay, left)
+        return delay
+
+
+def get_circuit_breaker(key, failure_threshold=5, reset_timeout=30):
+    """Get the circuit breaker shared by callers of the same endpoint"""
+
+    breakers = GenerativeAgentsMap.get(GenerativeAgentsKey.BREAKERS)
+    if breakers is None:
+        breakers = {}
+        GenerativeAgentsMap.set(GenerativeAgentsKey.BREAKERS, breakers)
+    if key not in breakers:
+        breakers[key] = CircuitBreaker(failure_threshold, reset_timeout)
+    return breakers[key]
@@ -0,0 +1,53 @@
+"""generative_agents.utils.text"""
+
+import re
+
+
+def char_ngrams(text, n=2):
+    text = re.sub(r"[\s，。！？、,.!?;；:：\"'“”‘’]+", "", text)
+    if len(text) < n:
+        return {text} if text else set()
+    return set(text[i : i + n] for i in range(len(text) - n + 1))
+
+
+def jaccard(a, b):
+    if not a or not b:
+        return 0
+    return len(a & b) / len(a | b)
+
+
+class RepeatDetector:
+    """Detect repeated chat content by char ngram overlap with earlier turns
+
+    check returns True for repeats (similarity >= high), False for new content
+    (similarity <= low) and None for ambiguous cases that should go to the llm.
+    """
+
+    def __init__(self, low=0.2, high=0.6, ngram=2):
+        self.low = low
+        self.high = high
+        self.ngram = ngram
+        self.summary = {"repeat": 0, "new": 0, "escalate": 0}
+
+    def similarity(self, text, history):
+        grams = char_ngrams(text, self.ngram)
+        scores = [jaccard(grams, char_ngrams(h, self.ngram)) for h in history]
+        # containment catches a short sentence copied from a longer turn
+        contains = [1 for h in history if len(text) > 3 and text in h]
+        return max(scores + contains + [0])
+
+    def check(self, text, history):
+        score = self.similarity(text, history)
+        if score >= self.high:
+            self.summary["repeat"] += 1
+            return True
+        if score <= self.low:
+            self.summary["new"] += 1
+            return False
+        self.summary["escalate"] += 1
+        return None
+
+    def abstract(self):
+        return "R:{},N:{},E:{}".format(
+            self.summary["repeat"], self.summary["new"], self.summary["escalate"]
+        )
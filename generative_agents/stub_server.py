@@ -0,0 +1,369 @@
+"""Deterministic stand-in for the Ollama/OpenAI endpoints, used for offline benchmarks
+
+    python stub_server.py --port 11434 --latency lognormal:0.8,0.5
+
+Chat completions recognise the templates in data/prompts and return canned answers
+that the Scratch.prompt_* callbacks accept, embeddings are hashed character bigrams.
+"""
+
+import os
+import re
+import json
+import math
+import time
+import random
+import hashlib
+import argparse
+import threading
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+
+ACTIVITIES = ["吃早餐", "读书", "工作", "吃午饭", "散步", "整理房间", "和朋友聊天", "吃晚饭", "看电视", "写日记"]
+
+
+def _seed(text):
+    return int(hashlib.md5(text.encode("utf-8")).hexdigest()[:8], 16)
+
+
+class PromptMatcher:
+    """Recognise which template in data/prompts built a prompt"""
+
+    def __init__(self, template_path="data/prompts", min_fragment=4):
+        self._fragments = {}
+        for file in sorted(os.listdir(template_path)):
+            if not file.endswith(".txt"):
+                continue
+            with open(os.path.join(template_path, file), "r", encoding="utf-8") as f:
+                content = f.read()
+            pieces = re.split(r"\$\{\w+\}|\$\w+|\n", content)
+            self._fragments[file[:-4]] = [
+                p.strip() for p in pieces if len(p.strip()) >= min_fragment
+            ]
+
+    def match(self, prompt):
+        best, best_len = None, 0
+        for name, fragments in self._fragments.items():
+            if not fragments or not all(f in prompt for f in fragments):
+                continue
+            # nested templates (base_desc, decide_wait_example) lose to their parents
+            total = sum(len(f) for f in fragments)
+            if total > best_len:
+                best, best_len = name, total
+        return best
+
+
+class StubResponder:
+    """Build canned responses for each template"""
+
+    def __init__(self, seed=0, chat_rate=0.3, terminate_rate=0.5):
+        self.seed = seed
+        self.chat_rate = chat_rate
+        self.terminate_rate = terminate_rate
+
+    def respond(self, name, prompt):
+        rng = random.Random(_seed(prompt) + self.seed)
+        handler = getattr(self, "_" + name, None) if name else None
+        if not handler:
+            return "好的"
+        return handler(prompt, rng)
+
+    def _poignancy_event(self, prompt, rng):
+        return "评分: {}".format(rng.choice([1, 1, 2, 2, 3, 3, 4, 5, 6, 8]))
+
+    _poignancy_chat = _poignancy_event
+
+    def _poignancy_batch(self, prompt, rng):
+        number = int(re.findall(r"需要评分的 (\d+) 条", prompt)[-1])
+        return "\n".join(
+            "{}. 评分：{}".format(i + 1, rng.choice([1, 1, 2, 2, 3, 3, 4, 5, 6, 8]))
+            for i in range(number)
+        )
+
+    def _wake_up(self, prompt, rng):
+        return "{}:00".format(rng.randint(5, 9))
+
+    def _schedule_init(self, prompt, rng):
+        wake_up = re.search(r"早上 (\d+) 点起床", prompt)
+        wake_up = int(wake_up.group(1)) if wake_up else 7
+        plans = ["早上 {} 点起床并完成晨间例行活动".format(wake_up)]
+        hours = list(range(wake_up + 1, 23, 2))
+        plans += ["{} 点{}".format(h, rng.choice(ACTIVITIES)) for h in hours]
+        plans.append("23 点睡觉")
+        return "\n".join("{}. {}".format(i + 1, p) for i, p in enumerate(plans))
+
+    def _schedule_daily(self, prompt, rng):
+        lines = []
+        for hour, activity in re.findall(r"\[(\d{1,2}:00)\] (\S+)", prompt):
+            if activity == "<活动>":
+                activity = rng.choice(ACTIVITIES)
+            lines.append("[{}] {}".format(hour, activity))
+        return "\n".join(lines)
+
+    def _schedule_decompose(self, prompt, rng):
+        found = re.findall(r"列出 (.+?) 在 (\d{1,2}):(\d{2}) 至 (\d{1,2}):(\d{2}) 期间", prompt)
+        agent, h1, m1, h2, m2 = found[-1]
+        left = (int(h2) * 60 + int(m2)) - (int(h1) * 60 + int(m1))
+        if left <= 0:
+            left += 24 * 60
+        lines = []
+        while left > 0 and len(lines) < 10:
+            duration = min(rng.choice([5, 10, 15, 20, 30]), left)
+            if len(lines) == 9:
+                duration = min(left, 95)
+            left -= duration
+            lines.append(
+                "{}) {} *计划* {}（耗时：{}，剩余：{}）".format(
+                    len(lines) + 1, agent, rng.choice(ACTIVITIES), duration, left
+                )
+            )
+        return "\n".join(lines)
+
+    def _schedule_revise(self, prompt, rng):
+        revised = prompt.split("修订后的时间表：")[-1]
+        lines = re.findall(r"^\[\d{1,2}:\d{2} 至 \d{1,2}:\d{2}\] .*$", revised, flags=re.M)
+        end = re.search(r"必须在 (\d{1,2}:\d{2}) 前结束", prompt)
+        if lines and end:
+            last = re.match(r"\[\d{1,2}:\d{2} 至 (\d{1,2}:\d{2})\]", lines[-1]).group(1)
+            if last != end.group(1):
+                lines.append("[{} 至 {}] {}".format(last, end.group(1), rng.choice(ACTIVITIES)))
+        return "\n".join(lines)
+
+    def _choose_from_list(self, prompt, rng):
+        options = re.findall(r"[:：]\[(.*)\]", prompt)
+        options = [o.strip() for o in options[-1].split(",")] if options else []
+        options = [o for o in options if o]
+        return rng.choice(options) if options else ""
+
+    _determine_sector = _choose_from_list
+    _determine_arena = _choose_from_list
+    _determine_object = _choose_from_list
+
+    def _describe_emoji(self, prompt, rng):
+        return rng.choice(["😀", "📖", "🍵", "💼", "🚶"])
+
+    def _describe_event(self, prompt, rng):
+        action = prompt.strip().split("输入：")[-1].split("\n")[0].strip()
+        return "(<{}>, <此时>, <{}>)".format(action[:2], action[2:] or action)
+
+    def _describe_object(self, prompt, rng):
+        obj = re.findall(r"思考 <(.+?)> 的状态", prompt)[-1]
+        return "<{}> {}".format(obj, rng.choice(["正在被使用", "空闲", "被占用"]))
+
+    def _decide_chat(self, prompt, rng):
+        return "是" if rng.random() < self.chat_rate else "否"
+
+    def _decide_chat_terminate(self, prompt, rng):
+        return "是" if rng.random() < self.terminate_rate else "否"
+
+    def _decide_wait(self, prompt, rng):
+        return "答案：<选项{}>".format(rng.choice("AB"))
+
+    def _generate_chat(self, prompt, rng):
+        agent, other = re.findall(r"现在 (.+?) 会对 (.+?) 说什么", prompt)[-1]
+        text = rng.choice(["你好，{}！", "{}，今天过得怎么样？", "最近在忙什么呢，{}？", "很高兴见到你，{}。"])
+        return json.dumps({agent: text.format(other)}, ensure_ascii=False)
+
+    def _generate_dialogue(self, prompt, rng):
+        agent, other = re.findall(r"写出 (.+?) 和 (.+?) 之间的完整对话", prompt)[-1]
+        max_turns = int(re.findall(r"最多 (\d+) 句", prompt)[-1])
+        texts = ["你好，{}！", "{}，今天过得怎么样？", "最近在忙什么呢，{}？", "很高兴见到你，{}。"]
+        turns = []
+        for i in range(rng.randint(2, max_turns)):
+            speaker, listener = (agent, other) if i % 2 == 0 else (other, agent)
+            turns.append({speaker: rng.choice(texts).format(listener)})
+        return json.dumps({"dialogue": turns}, ensure_ascii=False, indent=4)
+
+    def _generate_chat_check_repeat(self, prompt, rng):
+        return "否"
+
+    def _summarize_chats(self, prompt, rng):
+        return "两人互相问候并聊了聊近况"
+
+    def _summarize_relation(self, prompt, rng):
+        agent, other = re.findall(r"总结 (.+?) 和 (.+?) 之间的关系", prompt)[-1]
+        return "{} 和 {} 是邻居".format(agent, other)
+
+    def _reflect_focus(self, prompt, rng):
+        number = int(re.findall(r"提出 (\d+) 个", prompt)[-1])
+        return "\n".join("{}. 最近发生了什么重要的事情？".format(i + 1) for i in range(number))
+
+    def _reflect_insights(self, prompt, rng):
+        number = int(re.findall(r"汇总出 (\d+) 条", prompt)[-1])
+        reference = prompt.split('"""')[1]
+        count = max(len(re.findall(r"^\d+\. ", reference, flags=re.M)), 1)
+        lines = []
+        for i in range(number):
+            indices = sorted(set(rng.randrange(count) for _ in range(2)))
+            lines.append(
+                "{}. 生活规律而平静 (参考信息序号 {})".format(i + 1, ",".join(str(x) for x in indices))
+            )
+        return "\n".join(lines)
+
+    def _reflect_chat_planing(self, prompt, rng):
+        return "需要记住接下来的计划"
+
+    def _reflect_chat_memory(self, prompt, rng):
+        return "这次对话很愉快"
+
+    def _retrieve_plan(self, prompt, rng):
+        return "\n".join("{}. {}".format(i + 1, rng.choice(ACTIVITIES)) for i in range(3))
+
+    def _retrieve_thought(self, prompt, rng):
+        return "感觉今天过得很充实"
+
+    def _retrieve_currently(self, prompt, rng):
+        return "状态: 按照平常的习惯安排今天的生活"
+
+
+class Latency:
+    """Latency distributions, e.g. const:0.5, uniform:0.2,1.0, normal:0.8,0.2, lognormal:0.8,0.5"""
+
+    def __init__(self, spec="const:0", overrides=None, seed=0):
+        self._default = self._parse(spec)
+        self._overrides = {k: self._parse(v) for k, v in (overrides or {}).items()}
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+
+    def _parse(self, spec):
+        kind, _, args = spec.partition(":")
+        return kind, [float(a) for a in args.split(",") if a]
+
+    def sample(self, name):
+        kind, args = self._overrides.get(name, self._default)
+        with self._lock:
+            if kind == "uniform":
+                value = self._rng.uniform(*args)
+            elif kind == "normal":
+                value = self._rng.gauss(*args)
+            elif kind == "lognormal":
+                # args are the median and the sigma of log(latency)
+                value = self._rng.lognormvariate(math.log(args[0]), args[1])
+            else:
+                value = args[0] if args else 0
+        return max(value, 0)
+
+
+def embed(text, dim=256):
+    """Hashed character bigrams, texts sharing words end up close"""
+
+    vector = [0.0] * dim
+    for i in range(max(len(text) - 1, 1)):
+        h = _seed(text[i : i + 2])
+        vector[h % dim] += 1.0 if (h >> 16) % 2 else -1.0
+    norm = math.sqrt(sum(v * v for v in vector)) or 1.0
+    return [v / norm for v in vector]
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        if self.server.verbose:
+            super().log_message(format, *args)
+
+    def _send(self, data, status=200):
+        body = json.dumps(data, ensure_ascii=False).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        if self.path.rstrip("/").endswith("/models") or self.path.rstrip("/").endswith("/api/tags"):
+            return self._send({"object": "list", "data": [{"id": "stub", "object": "model"}], "models": []})
+        return self._send({"status": "ok"})
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length", 0))
+        request = json.loads(self.rfile.read(length) or b"{}")
+        path = self.path.rstrip("/")
+        if path.endswith("/chat/completions"):
+            return self._chat(request)
+        if path.endswith("/api/embed"):
+            inputs = request.get("input", [])
+            inputs = [inputs] if isinstance(inputs, str) else inputs
+            self._sleep("embedding")
+            return self._send({"model": request.get("model"), "embeddings": [embed(t) for t in inputs]})
+        if path.endswith("/api/embeddings"):
+            self._sleep("embedding")
+            return self._send({"embedding": embed(request.get("prompt", ""))})
+        if path.endswith("/embeddings"):
+            inputs = request.get("input", [])
+            inputs = [inputs] if isinstance(inputs, str) else inputs
+            self._sleep("embedding")
+            data = [{"object": "embedding", "index": i, "embedding": embed(t)} for i, t in enumerate(inputs)]
+            usage = {"prompt_tokens": 0, "total_tokens": 0}
+            return self._send({"object": "list", "model": request.get("model"), "data": data, "usage": usage})
+        return self._send({"error": "unknown path " + self.path}, 404)
+
+    def _sleep(self, name):
+        delay = self.server.latency.sample(name)
+        if delay:
+            time.sleep(delay)
+
+    def _chat(self, request):
+        prompt = request["messages"][-1]["content"].replace("\n/nothink", "")
+        name = self.server.matcher.match(prompt)
+        content = self.server.responder.respond(name, prompt)
+        self._sleep(name)
+        with self.server.lock:
+            self.server.counts[name] = self.server.counts.get(name, 0) + 1
+        self._send(
+            {
+                "id": "stub-" + hashlib.md5(prompt.encode("utf-8")).hexdigest()[:12],
+                "object": "chat.completion",
+                "created": int(time.time()),
+                "model": request.get("model", "stub"),
+                "choices": [
+                    {
+                        "index": 0,
+                        "finish_reason": "stop",
+                        "message": {"role": "assistant", "content": content},
+                    }
+                ],
+                "usage": {"prompt_tokens": len(prompt), "completion_tokens": len(content), "total_tokens": len(prompt) + len(content)},
+            }
+        )
+
+
+def create_server(host="127.0.0.1", port=11434, latency=None, seed=0, verbose=False, **kwargs):
+    server = ThreadingHTTPServer((host, port), StubHandler)
+    server.matcher = PromptMatcher()
+    server.responder = StubResponder(seed=seed, **kwargs)
+    server.latency = latency or Latency(seed=seed)
+    server.verbose = verbose
+    server.counts, server.lock = {}, threading.Lock()
+    return server
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="stub llm server for offline benchmarks")
+    parser.add_argument("--host", type=str, default="127.0.0.1", help="The host to listen")
+    parser.add_argument("--port", type=int, default=11434, help="The port to listen, same as Ollama by default")
+    parser.add_argument("--latency", type=str, default="const:0", help="Latency distribution of all responses")
+    parser.add_argument("--latency_config", type=str, default="", help="Json file of {<template>: <distribution>}, 'embedding' for embeddings")
+    parser.add_argument("--seed", type=int, default=0, help="The random seed")
+    parser.add_argument("--chat_rate", type=float, default=0.3, help="Probability to answer yes for decide_chat")
+    parser.add_argument("--terminate_rate", type=float, default=0.5, help="Probability to answer yes for decide_chat_terminate")
+    parser.add_argument("--verbose", action="store_true", help="Log every request")
+    args = parser.parse_args()
+
+    overrides = {}
+    if args.latency_config:
+        with open(args.latency_config, "r", encoding="utf-8") as f:
+            overrides = json.load(f)
+    server = create_server(
+        args.host,
+        args.port,
+        latency=Latency(args.latency, overrides, args.seed),
+        seed=args.seed,
+        verbose=args.verbose,
+        chat_rate=args.chat_rate,
+        terminate_rate=args.terminate_rate,
+    )
+    print(f"stub llm server listening on http://{args.host}:{args.port}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        print("requests: " + json.dumps(server.counts, ensure_ascii=False))